@@ -0,0 +1,186 @@
+"""
+Admission control in front of the app, so a burst on the public WhatsApp links
+cannot take the 10-connection DB pool (and every other endpoint) down with it.
+
+- Priority lane: requests carrying the admin api key (admin, gate and sensor
+  calls) may use every in-flight slot. Everything else is held back from the
+  last ADMISSION_PRIORITY_RESERVE of them.
+- Public routes get their own concurrency limit plus token-bucket rate limits
+  per client IP and, for exit links, per token.
+- Long-lived streams (sensor NDJSON, exports) have their own small caps
+  instead of holding in-flight slots; static assets and routes that never
+  touch the database are not counted at all.
+- Over a limit, requests are turned away at once with 503 (or 429 for rate
+  limits) and Retry-After instead of queueing until they time out.
+"""
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+API_KEY = os.getenv("ADMIN_API_KEY")
+
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "8"))
+ADMISSION_PRIORITY_RESERVE = int(os.getenv("ADMISSION_PRIORITY_RESERVE", "3"))
+ADMISSION_PUBLIC_CONCURRENCY = int(os.getenv("ADMISSION_PUBLIC_CONCURRENCY", "3"))
+ADMISSION_CLIENT_RATE = float(os.getenv("ADMISSION_CLIENT_RATE", "2"))      # requests/s per IP
+ADMISSION_CLIENT_BURST = float(os.getenv("ADMISSION_CLIENT_BURST", "10"))
+ADMISSION_TOKEN_RATE = float(os.getenv("ADMISSION_TOKEN_RATE", "0.2"))      # requests/s per exit token
+ADMISSION_TOKEN_BURST = float(os.getenv("ADMISSION_TOKEN_BURST", "3"))
+# Only behind a reverse proxy that appends the client address to X-Forwarded-For
+ADMISSION_TRUST_FORWARDED = os.getenv("ADMISSION_TRUST_FORWARDED", "0") == "1"
+ADMISSION_SENSOR_STREAMS = int(os.getenv("ADMISSION_SENSOR_STREAMS", "4"))
+ADMISSION_EXPORT_STREAMS = int(os.getenv("ADMISSION_EXPORT_STREAMS", "1"))
+
+# Path prefixes of the links sent to the public over WhatsApp
+PUBLIC_ROUTES = ("/register", "/reservations", "/slots/free_by_token/")
+TOKEN_ROUTE = "/slots/free_by_token/"
+# No database work behind these; not counted
+EXEMPT_ROUTES = ("/static/", "/dashboard", "/docs", "/redoc", "/openapi.json", "/favicon.ico",
+                 "/sensors/stats", "/admin/admission")
+# Long-lived responses, capped separately: path prefix -> max concurrent
+STREAM_ROUTES = {"/sensors/events": ADMISSION_SENSOR_STREAMS, "/admin/export/": ADMISSION_EXPORT_STREAMS}
+
+# Middleware instances register here so the admin route can read their counters
+COUNTERS_SOURCES = []
+
+
+class TokenBuckets:
+    """Token bucket per key, keeping at most max_keys keys (least recently used dropped)."""
+
+    def __init__(self, rate, burst, max_keys=50000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, last refill)
+
+    def take(self, key, now):
+        """Returns 0 if allowed, else seconds until a token is available."""
+        tokens, last = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class AdmissionControl:
+    """
+    Pure ASGI middleware. Runs on the event loop thread only, so the counters
+    need no locking.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.inflight = 0
+        self.public_inflight = 0
+        self.client_buckets = TokenBuckets(ADMISSION_CLIENT_RATE, ADMISSION_CLIENT_BURST)
+        self.token_buckets = TokenBuckets(ADMISSION_TOKEN_RATE, ADMISSION_TOKEN_BURST)
+        self.streams = dict.fromkeys(STREAM_ROUTES, 0)
+        self.counters = {
+            "admitted_priority": 0,
+            "admitted_normal": 0,
+            "shed_saturated": 0,
+            "shed_public_concurrency": 0,
+            "shed_client_rate": 0,
+            "shed_token_rate": 0,
+            "shed_streams": 0,
+        }
+        COUNTERS_SOURCES.append(self)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        path = scope["path"]
+        if path.startswith(EXEMPT_ROUTES):
+            return await self.app(scope, receive, send)
+        for prefix, cap in STREAM_ROUTES.items():
+            if path.startswith(prefix):
+                return await self._admit_stream(prefix, cap, scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        priority = bool(API_KEY) and (headers.get(b"api-key") or headers.get(b"api_key") or b"").decode() == API_KEY
+        public = not priority and path.startswith(PUBLIC_ROUTES)
+
+        # 1️⃣ Capacity: normal traffic leaves room for the priority lane
+        limit = ADMISSION_MAX_INFLIGHT if priority else ADMISSION_MAX_INFLIGHT - ADMISSION_PRIORITY_RESERVE
+        if self.inflight >= limit:
+            self.counters["shed_saturated"] += 1
+            return await _reject(send, 503, "Server busy, please retry shortly.", 1)
+        if public and self.public_inflight >= ADMISSION_PUBLIC_CONCURRENCY:
+            self.counters["shed_public_concurrency"] += 1
+            return await _reject(send, 503, "Server busy, please retry shortly.", 1)
+
+        # 2️⃣ Rate limits on public links: per client, and per exit token
+        if public:
+            now = time.monotonic()
+            wait = self.client_buckets.take(_client_ip(scope, headers), now)
+            if wait:
+                self.counters["shed_client_rate"] += 1
+                return await _reject(send, 429, "Too many requests.", wait)
+            if path.startswith(TOKEN_ROUTE):
+                wait = self.token_buckets.take(path[len(TOKEN_ROUTE):], now)
+                if wait:
+                    self.counters["shed_token_rate"] += 1
+                    return await _reject(send, 429, "Too many requests for this link.", wait)
+
+        # 3️⃣ Admit
+        self.counters["admitted_priority" if priority else "admitted_normal"] += 1
+        self.inflight += 1
+        self.public_inflight += public
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.inflight -= 1
+            self.public_inflight -= public
+
+    async def _admit_stream(self, prefix, cap, scope, receive, send):
+        if self.streams[prefix] >= cap:
+            self.counters["shed_streams"] += 1
+            return await _reject(send, 503, "Too many open streams, please retry shortly.", 5)
+        self.streams[prefix] += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.streams[prefix] -= 1
+
+
+def admission_stats():
+    if not COUNTERS_SOURCES:
+        return {}
+    control = COUNTERS_SOURCES[-1]
+    return {**control.counters, "inflight": control.inflight, "public_inflight": control.public_inflight,
+            "streams": dict(control.streams)}
+
+
+def _client_ip(scope, headers):
+    forwarded = headers.get(b"x-forwarded-for")
+    if ADMISSION_TRUST_FORWARDED and forwarded:
+        # The right-most entry is the one our proxy added; anything left of it came from the client
+        return forwarded.decode().split(",")[-1].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+async def _reject(send, status, detail, retry_after):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
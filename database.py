@@ -4,6 +4,9 @@ from psycopg2.extras import RealDictCursor
 from psycopg2 import pool
 from dotenv import load_dotenv
 import atexit
+import time
+import threading
+from contextvars import ContextVar
 
 # Load environment variables
 load_dotenv()
@@ -18,8 +21,21 @@ DB_PASS = os.getenv("POSTGRES_PASSWORD")
 DB_HOST = os.getenv("POSTGRES_HOST")
 DB_PORT = os.getenv("POSTGRES_PORT", "5432")
 
-# Global pool
+# Lot this deployment serves; slots without a provisioned layout belong to it
+LOT_CODE = os.getenv("LOT_CODE", "main")
+
+# Optional streaming replica for read-only endpoints
+REPLICA_DATABASE_URL = os.getenv("REPLICA_DATABASE_URL")
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "1"))
+
+# Global pools
 DB_POOL = None
+REPLICA_POOL = None
+_replica_retry_at = 0.0
+# Background threads may ask for their first connection at the same time
+_db_pool_lock = threading.Lock()
+_replica_pool_lock = threading.Lock()
 
 
 def init_db_pool(minconn=1, maxconn=10):
@@ -30,35 +46,70 @@ def init_db_pool(minconn=1, maxconn=10):
     global DB_POOL
     if DB_POOL:
         return DB_POOL
+    with _db_pool_lock:
+        if DB_POOL:
+            return DB_POOL
+        try:
+            if DATABASE_URL:
+                DB_POOL = pool.ThreadedConnectionPool(
+                    minconn, maxconn,
+                    DATABASE_URL,
+                    cursor_factory=RealDictCursor
+                )
+            else:
+                DB_POOL = pool.ThreadedConnectionPool(
+                    minconn, maxconn,
+                    dbname=DB_NAME,
+                    user=DB_USER,
+                    password=DB_PASS,
+                    host=DB_HOST,
+                    port=DB_PORT,
+                    cursor_factory=RealDictCursor
+                )
+            print("✅ Database connection pool initialized.")
+            return DB_POOL
+        except Exception as e:
+            print("❌ Database pool initialization failed:", e)
+            raise
 
-    try:
-        if DATABASE_URL:
-            DB_POOL = pool.ThreadedConnectionPool(
-                minconn, maxconn,
-                DATABASE_URL,
-                cursor_factory=RealDictCursor
-            )
-        else:
-            DB_POOL = pool.ThreadedConnectionPool(
+
+def init_replica_pool(minconn=1, maxconn=10):
+    """
+    Initializes the read-replica pool when REPLICA_DATABASE_URL is set.
+    Returns None (and reads stay on the primary) otherwise.
+    """
+    global REPLICA_POOL, _replica_retry_at
+    if REPLICA_POOL or not REPLICA_DATABASE_URL:
+        return REPLICA_POOL
+    with _replica_pool_lock:
+        if REPLICA_POOL:
+            return REPLICA_POOL
+        if time.monotonic() < _replica_retry_at:
+            return None
+
+        try:
+            REPLICA_POOL = pool.ThreadedConnectionPool(
                 minconn, maxconn,
-                dbname=DB_NAME,
-                user=DB_USER,
-                password=DB_PASS,
-                host=DB_HOST,
-                port=DB_PORT,
+                REPLICA_DATABASE_URL,
                 cursor_factory=RealDictCursor
             )
-        print("✅ Database connection pool initialized.")
-        return DB_POOL
-    except Exception as e:
-        print("❌ Database pool initialization failed:", e)
-        raise
+            print("✅ Replica connection pool initialized.")
+            return REPLICA_POOL
+        except Exception as e:
+            print("❌ Replica pool initialization failed, reads will use the primary:", e)
+            _replica_retry_at = time.monotonic() + 30
+            return None
 
 
 def get_db_connection():
     """
     Gets a connection from the pool. Initializes the pool if needed.
     """
+    _mark_primary_used()
+    return _primary_connection()
+
+
+def _primary_connection():
     global DB_POOL
     if DB_POOL is None:
         init_db_pool()
@@ -79,30 +130,160 @@ def release_db_connection(conn):
         DB_POOL.putconn(conn)
 
 
+# --- Read routing ---
+# Per-request state set up by the middleware in main.py:
+#   "min_lsn"      → primary WAL position the client last wrote at (from its cookie)
+#   "used_primary" → set when the request borrowed a primary connection
+REQUEST_DB_STATE = ContextVar("request_db_state", default=None)
+
+_replica_status = {"checked_at": 0.0, "replay_lsn": 0, "lag": None}
+_replica_status_lock = threading.Lock()
+_replica_conn_ids = set()
+
+
+def parse_lsn(lsn):
+    """'16/B374D848' → integer, so WAL positions can be compared."""
+    try:
+        high, low = str(lsn).split("/")
+        return (int(high, 16) << 32) + int(low, 16)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _mark_primary_used():
+    state = REQUEST_DB_STATE.get()
+    if state is not None:
+        state["used_primary"] = True
+
+
+def _refresh_replica_status(conn):
+    """
+    Re-reads replay position and lag from the replica at most once per
+    REPLICA_CHECK_INTERVAL. A replica that has replayed everything it received
+    counts as zero lag, even if the primary has been idle for a while, but only
+    while its WAL receiver is streaming: one that has lost the primary has also
+    replayed everything it received. Without a streaming receiver (or without
+    pg_read_all_stats to see it) the lag is unknown and reads go to the primary.
+    """
+    now = time.monotonic()
+    if now - _replica_status["checked_at"] < REPLICA_CHECK_INTERVAL:
+        return _replica_status
+    with _replica_status_lock:
+        if now - _replica_status["checked_at"] < REPLICA_CHECK_INTERVAL:
+            return _replica_status
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT pg_last_wal_replay_lsn()::text AS replay_lsn,
+                       (SELECT status FROM pg_stat_wal_receiver) AS receiver_status,
+                       CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+                       END AS lag;
+            """)
+            row = cursor.fetchone()
+        conn.rollback()
+        streaming = row["receiver_status"] == "streaming"
+        _replica_status.update(
+            checked_at=now,
+            replay_lsn=parse_lsn(row["replay_lsn"]),
+            lag=float(row["lag"]) if streaming and row["lag"] is not None else None,
+        )
+    return _replica_status
+
+
+def get_read_connection():
+    """
+    Gets a connection for a read-only query. Uses the replica when it is
+    configured, caught up within REPLICA_MAX_LAG_SECONDS and has replayed the
+    client's last write; falls back to the primary otherwise.
+    Return it with release_read_connection().
+    """
+    if REPLICA_POOL is None:
+        init_replica_pool()
+    if REPLICA_POOL is None:
+        return _primary_connection()
+
+    try:
+        conn = REPLICA_POOL.getconn()
+    except Exception as e:
+        print("⚠️ Replica unavailable, reading from primary:", e)
+        return _primary_connection()
+
+    try:
+        status = _refresh_replica_status(conn)
+    except Exception as e:
+        print("⚠️ Replica status check failed, reading from primary:", e)
+        REPLICA_POOL.putconn(conn, close=True)
+        _replica_status["checked_at"] = 0.0
+        return _primary_connection()
+
+    state = REQUEST_DB_STATE.get() or {}
+    too_far_behind = status["lag"] is None or status["lag"] > REPLICA_MAX_LAG_SECONDS
+    missing_own_write = status["replay_lsn"] < state.get("min_lsn", 0)
+    if too_far_behind or missing_own_write:
+        REPLICA_POOL.putconn(conn)
+        return _primary_connection()
+
+    _replica_conn_ids.add(id(conn))
+    return conn
+
+
+def release_read_connection(conn):
+    """
+    Returns a connection from get_read_connection() to whichever pool it came from.
+    """
+    if conn is None:
+        return
+    if id(conn) in _replica_conn_ids:
+        _replica_conn_ids.discard(id(conn))
+        conn.rollback()
+        REPLICA_POOL.putconn(conn)
+    else:
+        release_db_connection(conn)
+
+
+def current_primary_lsn():
+    """
+    Current WAL insert position on the primary, handed to clients after they
+    write so their next reads wait for the replica to catch up.
+    """
+    conn = DB_POOL.getconn()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_current_wal_lsn()::text AS lsn;")
+            lsn = cursor.fetchone()["lsn"]
+        conn.rollback()
+        return lsn
+    finally:
+        DB_POOL.putconn(conn)
+
+
 # Automatically close pool when app shuts down
 @atexit.register
 def close_db_pool():
-    global DB_POOL
+    global DB_POOL, REPLICA_POOL
     if DB_POOL:
         DB_POOL.closeall()
         print("🧹 Database connection pool closed.")
+    if REPLICA_POOL:
+        REPLICA_POOL.closeall()
+        print("🧹 Replica connection pool closed.")
 
 
 # --- Optional helper functions (your existing ones, using the pool safely) ---
 
 def get_all_slots():
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute("SELECT slot_id, is_occupied, vehicle_id FROM slots ORDER BY slot_id;")
             slots = cursor.fetchall()
             return slots
     finally:
-        release_db_connection(conn)
+        release_read_connection(conn)
 
 
 def get_slot_by_id(slot_id: int):
-    conn = get_db_connection()
+    conn = get_read_connection()
     try:
         with conn.cursor() as cursor:
             cursor.execute(
@@ -112,7 +293,7 @@ def get_slot_by_id(slot_id: int):
             slot = cursor.fetchone()
             return slot
     finally:
-        release_db_connection(conn)
+        release_read_connection(conn)
 
 
 def free_slot(slot_id: int):
@@ -0,0 +1,76 @@
+from identity import NORMALIZED_PHONE_SQL, NORMALIZED_PLATE_SQL
+
+
+def dedupe_identities(cursor):
+    """
+    One-time cleanup from the days when every visit inserted a new user and vehicle.
+    Normalises phones/plates, keeps one row per phone and per plate, repoints
+    references to the survivor and deletes the rest. Caller commits.
+    """
+    counts = {}
+
+    # 1️⃣ Users: keep the oldest row per phone number
+    cursor.execute(f"UPDATE users SET phone = {NORMALIZED_PHONE_SQL} WHERE phone IS NOT NULL;")
+    cursor.execute("""
+        CREATE TEMP TABLE user_merge ON COMMIT DROP AS
+        SELECT user_id, MIN(user_id) OVER (PARTITION BY phone) AS keep_id
+        FROM users WHERE phone IS NOT NULL;
+    """)
+    cursor.execute("""
+        UPDATE vehicles v SET user_id = m.keep_id
+        FROM user_merge m
+        WHERE v.user_id = m.user_id AND m.user_id <> m.keep_id;
+    """)
+    cursor.execute("""
+        DELETE FROM users u USING user_merge m
+        WHERE u.user_id = m.user_id AND m.user_id <> m.keep_id;
+    """)
+    counts["users_removed"] = cursor.rowcount
+
+    # 2️⃣ Vehicles: keep the parked row per plate, else the latest one
+    cursor.execute(f"UPDATE vehicles SET license_plate = {NORMALIZED_PLATE_SQL} WHERE license_plate IS NOT NULL;")
+    cursor.execute("""
+        CREATE TEMP TABLE vehicle_merge ON COMMIT DROP AS
+        SELECT v.vehicle_id,
+               FIRST_VALUE(v.vehicle_id) OVER (
+                   PARTITION BY v.license_plate
+                   ORDER BY (s.slot_id IS NOT NULL) DESC, v.entry_time DESC NULLS LAST, v.vehicle_id DESC
+               ) AS keep_id
+        FROM vehicles v
+        LEFT JOIN slots s ON s.vehicle_id = v.vehicle_id
+        WHERE v.license_plate IS NOT NULL;
+    """)
+    cursor.execute("""
+        UPDATE slots s SET vehicle_id = m.keep_id
+        FROM vehicle_merge m
+        WHERE s.vehicle_id = m.vehicle_id AND m.vehicle_id <> m.keep_id;
+    """)
+    cursor.execute("""
+        UPDATE free_tokens t SET vehicle_id = m.keep_id
+        FROM vehicle_merge m
+        WHERE t.vehicle_id = m.vehicle_id AND m.vehicle_id <> m.keep_id;
+    """)
+    cursor.execute("""
+        DELETE FROM vehicles v USING vehicle_merge m
+        WHERE v.vehicle_id = m.vehicle_id AND m.vehicle_id <> m.keep_id;
+    """)
+    counts["vehicles_removed"] = cursor.rowcount
+
+    return counts
+
+
+if __name__ == "__main__":
+    from database import get_db_connection, release_db_connection
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            counts = dedupe_identities(cursor)
+        conn.commit()
+        print(f"🧹 Removed {counts['users_removed']} duplicate users and "
+              f"{counts['vehicles_removed']} duplicate vehicles.")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
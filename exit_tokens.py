@@ -0,0 +1,87 @@
+"""
+Signed exit links: the token itself carries vehicle_id, slot_id, session_id
+and expiry, authenticated with an HMAC, so expired, forged or mangled links
+are turned away without a database round trip and registration no longer
+has to store a free_tokens row.
+
+Single use comes from the exit itself: the parking session named in the token
+can only be closed once. Old UUID links (stored in free_tokens) keep working
+until they expire.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import os
+import struct
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Without a secret, registration falls back to stored UUID tokens
+EXIT_TOKEN_SECRET = os.getenv("EXIT_TOKEN_SECRET")
+EXIT_TOKEN_TTL_SECONDS = int(os.getenv("EXIT_TOKEN_TTL_SECONDS", str(2 * 3600)))
+
+_VERSION = 1
+_PAYLOAD = struct.Struct(">BIIQI")  # version, vehicle_id, slot_id, session_id, expires (unix s)
+_SIG_BYTES = 12
+
+
+class InvalidExitToken(Exception):
+    pass
+
+
+class ExpiredExitToken(InvalidExitToken):
+    pass
+
+
+def signing_enabled():
+    return bool(EXIT_TOKEN_SECRET)
+
+
+def is_legacy_token(token: str) -> bool:
+    """UUID links issued before signed tokens (or while no secret is set)."""
+    try:
+        uuid.UUID(token)
+        return True
+    except ValueError:
+        return False
+
+
+def _sign(payload: bytes) -> bytes:
+    return hmac.new(EXIT_TOKEN_SECRET.encode(), payload, hashlib.sha256).digest()[:_SIG_BYTES]
+
+
+def make_token(vehicle_id: int, slot_id: int, session_id: int, ttl_seconds=EXIT_TOKEN_TTL_SECONDS) -> str:
+    expires = int(time.time()) + ttl_seconds
+    payload = _PAYLOAD.pack(_VERSION, vehicle_id, slot_id, session_id, expires)
+    return base64.urlsafe_b64encode(payload + _sign(payload)).decode().rstrip("=")
+
+
+def verify_token(token: str) -> dict:
+    """
+    Returns the token's claims. Raises InvalidExitToken for malformed or forged
+    tokens and ExpiredExitToken once it is past its expiry.
+    """
+    if not EXIT_TOKEN_SECRET:
+        raise InvalidExitToken("signed tokens are not enabled")
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except (binascii.Error, ValueError):
+        raise InvalidExitToken("malformed token")
+    if len(raw) != _PAYLOAD.size + _SIG_BYTES:
+        raise InvalidExitToken("malformed token")
+
+    payload, signature = raw[:_PAYLOAD.size], raw[_PAYLOAD.size:]
+    if not hmac.compare_digest(signature, _sign(payload)):
+        raise InvalidExitToken("bad signature")
+
+    version, vehicle_id, slot_id, session_id, expires = _PAYLOAD.unpack(payload)
+    if version != _VERSION:
+        raise InvalidExitToken("unknown token version")
+    if time.time() > expires:
+        raise ExpiredExitToken("token expired")
+    return {"vehicle_id": vehicle_id, "slot_id": slot_id, "session_id": session_id, "expires": expires}
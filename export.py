@@ -0,0 +1,175 @@
+"""
+Streaming export of parking sessions for finance.
+
+Rows come through a server-side (named) cursor in batches of EXPORT_FETCH_SIZE
+and are encoded batch by batch, so memory stays flat however many rows match.
+
+    python export.py --month 2026-09 --format csv --gzip -o sessions-2026-09.csv.gz
+    python export.py --month 2026-09 --format parquet -o sessions-2026-09.parquet
+"""
+import argparse
+import csv
+import io
+import os
+import uuid
+import zlib
+from datetime import date
+
+import psycopg2.extensions
+
+from database import get_read_connection, release_read_connection
+
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "5000"))
+# Upper bound for ?fetch_size= on the export endpoint; a batch is held in memory
+EXPORT_MAX_FETCH_SIZE = 50000
+PARQUET_ROW_GROUP_ROWS = int(os.getenv("PARQUET_ROW_GROUP_ROWS", "100000"))
+
+SESSION_COLUMNS = [
+    "session_id", "slot_id", "license_plate", "vehicle_type",
+    "entry_time", "exit_time", "duration_minutes", "amount_due",
+]
+SESSION_QUERY = """
+    SELECT session_id, slot_id, license_plate, vehicle_type, entry_time, exit_time,
+           (EXTRACT(EPOCH FROM exit_time - entry_time) / 60)::int AS duration_minutes,
+           amount_due
+    FROM parking_sessions
+    WHERE entry_time >= %s AND entry_time < %s
+    ORDER BY session_id;
+"""
+
+
+def month_range(month: str):
+    """'2026-09' → (2026-09-01, 2026-10-01)"""
+    start = date.fromisoformat(f"{month}-01")
+    end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return start, end
+
+
+def iter_session_batches(start, end, fetch_size=EXPORT_FETCH_SIZE):
+    """Yields lists of row tuples from a named cursor; one batch in memory at a time."""
+    conn = get_read_connection()
+    try:
+        cursor = conn.cursor(name=f"export_{uuid.uuid4().hex}", cursor_factory=psycopg2.extensions.cursor)
+        cursor.itersize = fetch_size
+        cursor.execute(SESSION_QUERY, (start, end))
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield rows
+        cursor.close()
+    finally:
+        conn.rollback()
+        release_read_connection(conn)
+
+
+# ------------------ Encoders ------------------
+def iter_csv(batches, gzip=False):
+    """CSV bytes, header first, optionally gzip-compressed on the fly."""
+    compressor = zlib.compressobj(wbits=31) if gzip else None
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    def emit():
+        data = buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+        return compressor.compress(data) if compressor else data
+
+    writer.writerow(SESSION_COLUMNS)
+    yield emit()
+    for rows in batches:
+        writer.writerows(rows)
+        chunk = emit()
+        if chunk:
+            yield chunk
+    if compressor:
+        yield compressor.flush()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to the caller instead of storing them."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_parquet(batches, compression="gzip", row_group_rows=PARQUET_ROW_GROUP_ROWS):
+    """Parquet bytes, one row group per row_group_rows rows. Needs pyarrow."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("session_id", pa.int64()),
+        ("slot_id", pa.int32()),
+        ("license_plate", pa.string()),
+        ("vehicle_type", pa.string()),
+        ("entry_time", pa.timestamp("us", tz="UTC")),
+        ("exit_time", pa.timestamp("us", tz="UTC")),
+        ("duration_minutes", pa.int32()),
+        ("amount_due", pa.decimal128(10, 2)),
+    ])
+
+    def to_table(rows):
+        columns = list(zip(*rows))
+        return pa.Table.from_arrays([pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema)
+
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression=compression)
+
+    pending = []
+    for rows in batches:
+        pending.extend(rows)
+        if len(pending) >= row_group_rows:
+            writer.write_table(to_table(pending))
+            pending.clear()
+            yield sink.take()
+    if pending:
+        writer.write_table(to_table(pending))
+    writer.close()
+    yield sink.take()
+
+
+def export_sessions(start, end, fmt="csv", gzip=False, fetch_size=EXPORT_FETCH_SIZE):
+    batches = iter_session_batches(start, end, fetch_size)
+    if fmt == "parquet":
+        return iter_parquet(batches, compression="gzip" if gzip else "snappy")
+    return iter_csv(batches, gzip=gzip)
+
+
+if __name__ == "__main__":
+    import time
+
+    parser = argparse.ArgumentParser(description="Export parking sessions for a month.")
+    parser.add_argument("--month", required=True, help="YYYY-MM")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--fetch-size", type=int, default=EXPORT_FETCH_SIZE)
+    parser.add_argument("-o", "--output", required=True)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    start, end = month_range(args.month)
+    written = 0
+    with open(args.output, "wb") as f:
+        for chunk in export_sessions(start, end, args.format, args.gzip, args.fetch_size):
+            f.write(chunk)
+            written += len(chunk)
+    print(f"📦 Wrote {written:,} bytes to {args.output} in {time.perf_counter() - started:.1f}s")
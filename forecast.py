@@ -0,0 +1,234 @@
+"""
+Occupancy forecasting: a time-of-week profile per (lot, vehicle type), where
+each 15-minute bin of the week is an exponentially smoothed average of the
+occupancy seen in that bin on previous weeks.
+
+Snapshots of current occupancy go to occupancy_snapshots once per bin (one
+worker writes, guarded by an advisory lock); every worker folds new snapshots
+into its in-memory profiles, so /slots/forecast never touches the database.
+"""
+import os
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from database import get_db_connection, release_db_connection, get_read_connection, release_read_connection, LOT_CODE
+from pricing import RATE_MAP
+
+FORECAST_BIN_MINUTES = int(os.getenv("FORECAST_BIN_MINUTES", "15"))
+FORECAST_ALPHA = float(os.getenv("FORECAST_ALPHA", "0.3"))
+FORECAST_TZ = os.getenv("FORECAST_TZ", "Asia/Kolkata")
+FORECAST_REFRESH_SECONDS = float(os.getenv("FORECAST_REFRESH_SECONDS", "60"))
+
+BINS_PER_WEEK = 7 * 24 * 60 // FORECAST_BIN_MINUTES
+ALL_TYPES = "all"
+SNAPSHOT_LOCK_KEY = 7240301  # pg advisory lock id for the snapshot writer
+
+# Local time-of-week bin of taken_at, computed in SQL so DST rules come from Postgres
+_BIN_SQL = f"""
+    ((EXTRACT(ISODOW FROM taken_at AT TIME ZONE %(tz)s)::int - 1) * 1440
+     + EXTRACT(HOUR FROM taken_at AT TIME ZONE %(tz)s)::int * 60
+     + EXTRACT(MINUTE FROM taken_at AT TIME ZONE %(tz)s)::int) / {FORECAST_BIN_MINUTES}
+"""
+
+
+def smooth_by_bin(groups, values, n_groups, alpha=FORECAST_ALPHA):
+    """
+    Exponential smoothing of each group's observations (in time order),
+    vectorized: the final smoothed value is a weighted sum where the k-th of n
+    observations gets alpha * (1 - alpha) ** (n - 1 - k), and the first one
+    (the seed) gets (1 - alpha) ** (n - 1).
+    Returns (smoothed, seen) arrays of length n_groups.
+    """
+    groups = np.asarray(groups, dtype=np.int64)
+    values = np.asarray(values, dtype=float)
+    order = np.argsort(groups, kind="stable")  # keeps time order within a group
+    groups, values = groups[order], values[order]
+
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rank = np.arange(groups.size) - starts[groups]
+    from_end = counts[groups] - 1 - rank
+
+    weights = alpha * (1 - alpha) ** from_end
+    weights[rank == 0] = (1 - alpha) ** from_end[rank == 0]
+
+    smoothed = np.bincount(groups, weights=weights * values, minlength=n_groups)
+    return smoothed, counts > 0
+
+
+class OccupancyForecaster:
+    def __init__(self, alpha=FORECAST_ALPHA):
+        self.alpha = alpha
+        self._profiles = {}  # (lot, vehicle_type) -> smoothed occupancy per bin
+        self._seen = {}      # (lot, vehicle_type) -> which bins have data
+        self._capacity = {}  # lot -> slots at the last snapshot
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    # ---- training ----
+    def fit(self, rows):
+        """Rebuilds every profile from (snapshot_id, lot, vehicle_type, bin, occupied, capacity) rows."""
+        if not rows:
+            return
+        keys = sorted({(r["lot_code"], r["vehicle_type"]) for r in rows})
+        key_index = {key: i for i, key in enumerate(keys)}
+        groups = np.fromiter((key_index[(r["lot_code"], r["vehicle_type"])] * BINS_PER_WEEK + r["week_bin"]
+                              for r in rows), dtype=np.int64, count=len(rows))
+        values = np.fromiter((r["occupied"] for r in rows), dtype=float, count=len(rows))
+
+        smoothed, seen = smooth_by_bin(groups, values, len(keys) * BINS_PER_WEEK, self.alpha)
+        smoothed = smoothed.reshape(len(keys), BINS_PER_WEEK)
+        seen = seen.reshape(len(keys), BINS_PER_WEEK)
+
+        with self._lock:
+            for key, i in key_index.items():
+                self._profiles[key] = smoothed[i]
+                self._seen[key] = seen[i]
+            for r in rows:
+                self._capacity[r["lot_code"]] = r["capacity"]
+            self._last_id = max(self._last_id, max(r["snapshot_id"] for r in rows))
+
+    def update(self, rows):
+        """Folds a handful of new snapshots into the profiles in place."""
+        with self._lock:
+            for r in rows:
+                key = (r["lot_code"], r["vehicle_type"])
+                if key not in self._profiles:
+                    self._profiles[key] = np.zeros(BINS_PER_WEEK)
+                    self._seen[key] = np.zeros(BINS_PER_WEEK, dtype=bool)
+                profile, seen, b = self._profiles[key], self._seen[key], r["week_bin"]
+                if seen[b]:
+                    profile[b] = self.alpha * r["occupied"] + (1 - self.alpha) * profile[b]
+                else:
+                    profile[b], seen[b] = r["occupied"], True
+                self._capacity[r["lot_code"]] = r["capacity"]
+                self._last_id = max(self._last_id, r["snapshot_id"])
+
+    # ---- serving ----
+    def predict(self, at: datetime, lot=LOT_CODE, vehicle_type=ALL_TYPES):
+        """Expected occupied slots at `at`, or None when there is no history for that bin."""
+        local = at.astimezone(ZoneInfo(FORECAST_TZ))
+        b = (local.weekday() * 1440 + local.hour * 60 + local.minute) // FORECAST_BIN_MINUTES
+        profile = self._profiles.get((lot, vehicle_type))
+        if profile is None or not self._seen[(lot, vehicle_type)][b]:
+            return None
+        capacity = self._capacity.get(lot)
+        expected = float(profile[b])
+        return {
+            "lot": lot,
+            "vehicle_type": vehicle_type,
+            "at": local.isoformat(),
+            "expected_occupied": round(expected, 1),
+            "capacity": capacity,
+            "expected_free": round(max(capacity - expected, 0), 1) if capacity is not None else None,
+        }
+
+
+FORECASTER = OccupancyForecaster()
+
+
+# ------------------ Snapshots ------------------
+def take_snapshot():
+    """
+    Records current occupancy per vehicle type (plus the lot total) unless
+    another worker already did so for this bin.
+    """
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked;", (SNAPSHOT_LOCK_KEY,))
+            if not cursor.fetchone()["locked"]:
+                conn.rollback()
+                return False
+            cursor.execute("""
+                SELECT COALESCE(MAX(taken_at), 'epoch') > now() - make_interval(mins => %s) AS recent
+                FROM occupancy_snapshots;
+            """, (FORECAST_BIN_MINUTES,))
+            if cursor.fetchone()["recent"]:
+                conn.rollback()
+                return False
+            cursor.execute("""
+                WITH per_lot AS (
+                    SELECT lot_code, COUNT(*) AS capacity, COUNT(*) FILTER (WHERE is_occupied) AS occupied
+                    FROM slots GROUP BY lot_code
+                ), per_type AS (
+                    SELECT s.lot_code, v.vehicle_type, COUNT(*) AS occupied
+                    FROM slots s JOIN vehicles v ON v.vehicle_id = s.vehicle_id
+                    WHERE s.is_occupied
+                    GROUP BY s.lot_code, v.vehicle_type
+                )
+                INSERT INTO occupancy_snapshots (taken_at, lot_code, vehicle_type, occupied, capacity)
+                SELECT now(), lot_code, %(all)s, occupied, capacity FROM per_lot
+                UNION ALL
+                SELECT now(), l.lot_code, t.vehicle_type, COALESCE(p.occupied, 0), l.capacity
+                FROM per_lot l
+                CROSS JOIN unnest(%(types)s::text[]) AS t(vehicle_type)
+                LEFT JOIN per_type p ON p.lot_code = l.lot_code AND p.vehicle_type = t.vehicle_type;
+            """, {"all": ALL_TYPES, "types": list(RATE_MAP)})
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+
+def load_snapshots(after_id=0):
+    conn = get_read_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT snapshot_id, lot_code, vehicle_type, occupied, capacity, {_BIN_SQL} AS week_bin
+                FROM occupancy_snapshots
+                WHERE snapshot_id > %(after)s
+                ORDER BY snapshot_id;
+            """, {"tz": FORECAST_TZ, "after": after_id})
+            return cursor.fetchall()
+    finally:
+        release_read_connection(conn)
+
+
+def refresh(forecaster=FORECASTER):
+    """Takes a snapshot if one is due and folds any new ones into the model."""
+    take_snapshot()
+    rows = load_snapshots(forecaster._last_id)
+    if forecaster._last_id == 0:
+        forecaster.fit(rows)
+    else:
+        forecaster.update(rows)
+
+
+# ------------------ Background refresher ------------------
+_stop = threading.Event()
+_thread = None
+
+
+def _refresh_loop():
+    while True:
+        try:
+            refresh()
+        except Exception as e:
+            print(f"❌ Forecast refresh failed: {e}")
+        if _stop.wait(FORECAST_REFRESH_SECONDS):
+            break
+
+
+def start():
+    global _thread
+    if _thread:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_refresh_loop, name="forecast-refresh", daemon=True)
+    _thread.start()
+
+
+def stop():
+    global _thread
+    _stop.set()
+    if _thread:
+        _thread.join(timeout=5)
+    _thread = None
@@ -0,0 +1,161 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# How many phone → user_id and plate → vehicle_id entries each worker keeps
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", "10000"))
+
+
+class LRUCache:
+    """
+    Small thread-safe LRU map. Sync routes run in FastAPI's threadpool,
+    so every access goes through a lock.
+    """
+
+    def __init__(self, maxsize=IDENTITY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+USER_CACHE = LRUCache()
+VEHICLE_CACHE = LRUCache()
+
+
+# ------------------ Normalisation ------------------
+def normalize_phone(phone_number: str) -> str:
+    """Strip spaces/dashes and assume Indian numbers when no country code is given."""
+    phone = re.sub(r"[\s-]", "", phone_number or "")
+    if not phone.startswith("+"):
+        phone = "+91" + phone
+    return phone
+
+
+def normalize_plate(license_plate: str) -> str:
+    """'mh 01-ab 1234' → 'MH01AB1234'"""
+    return re.sub(r"[^A-Z0-9]", "", (license_plate or "").upper())
+
+
+# Characters plate-reading cameras confuse; folding both sides to digits lets
+# 'MHO1AB1234' find 'MH01AB1234'. Keep the two strings the same length.
+PLATE_OCR_LETTERS = "OI"
+PLATE_OCR_DIGITS = "01"
+_PLATE_FOLD = str.maketrans(PLATE_OCR_LETTERS, PLATE_OCR_DIGITS)
+
+
+def fold_plate(license_plate: str) -> str:
+    """Normalised plate with OCR look-alikes collapsed: 'MHO1-AB-I234' → 'MH01AB1234'"""
+    return normalize_plate(license_plate).translate(_PLATE_FOLD)
+
+
+# SQL equivalents, used by the dedupe job so existing rows match new ones
+NORMALIZED_PHONE_SQL = r"""
+    CASE WHEN regexp_replace(phone, '[\s-]', '', 'g') LIKE '+%'
+         THEN regexp_replace(phone, '[\s-]', '', 'g')
+         ELSE '+91' || regexp_replace(phone, '[\s-]', '', 'g')
+    END
+"""
+NORMALIZED_PLATE_SQL = "regexp_replace(upper(license_plate), '[^A-Z0-9]', '', 'g')"
+# For columns that already hold normalised plates (parking_sessions)
+FOLDED_PLATE_SQL = f"translate(license_plate, '{PLATE_OCR_LETTERS}', '{PLATE_OCR_DIGITS}')"
+
+
+# ------------------ Lookup-or-create ------------------
+def resolve_user(cursor, user_name: str, phone_number: str):
+    """
+    Returns the user_id for this phone number, creating the user on first visit.
+    Cache hits skip the database entirely.
+    """
+    phone = normalize_phone(phone_number)
+    user_id = USER_CACHE.get(phone)
+    if user_id is not None:
+        return user_id
+
+    cursor.execute("""
+        INSERT INTO users (user_name, phone)
+        VALUES (%s, %s)
+        ON CONFLICT (phone) DO UPDATE SET user_name = EXCLUDED.user_name
+        RETURNING user_id;
+    """, (user_name, phone))
+    row = cursor.fetchone()
+    return row["user_id"] if isinstance(row, dict) else row[0]
+
+
+def resolve_vehicle(cursor, license_plate: str, user_id: int, vehicle_type: str,
+                    phone_number: str, parked_slot=None, entry_time=None):
+    """
+    Returns the vehicle_id for this plate, creating the vehicle on first visit
+    and refreshing its owner and parking details in the same statement.
+
+    Returns None when the vehicle is still parked in a slot, so callers can
+    refuse a second registration instead of orphaning the first slot.
+    """
+    plate = normalize_plate(license_plate)
+    params = (user_id, vehicle_type, phone_number, parked_slot, entry_time)
+
+    vehicle_id = VEHICLE_CACHE.get(plate)
+    if vehicle_id is not None:
+        cursor.execute("""
+            UPDATE vehicles
+            SET user_id = %s, vehicle_type = %s, phone_number = %s,
+                parked_slot = %s, entry_time = %s
+            WHERE vehicle_id = %s
+              AND NOT EXISTS (SELECT 1 FROM slots WHERE slots.vehicle_id = vehicles.vehicle_id);
+        """, params + (vehicle_id,))
+        if cursor.rowcount:
+            return vehicle_id
+        # Either deleted or still parked — let the upsert below decide
+        VEHICLE_CACHE.discard(plate)
+
+    cursor.execute("""
+        INSERT INTO vehicles (
+            license_plate, user_id, vehicle_type, phone_number, parked_slot, entry_time
+        ) VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (license_plate) DO UPDATE SET
+            user_id = EXCLUDED.user_id,
+            vehicle_type = EXCLUDED.vehicle_type,
+            phone_number = EXCLUDED.phone_number,
+            parked_slot = EXCLUDED.parked_slot,
+            entry_time = EXCLUDED.entry_time
+        WHERE NOT EXISTS (SELECT 1 FROM slots WHERE slots.vehicle_id = vehicles.vehicle_id)
+        RETURNING vehicle_id;
+    """, (plate,) + params)
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return row["vehicle_id"] if isinstance(row, dict) else row[0]
+
+
+def remember_identity(phone_number=None, user_id=None, license_plate=None, vehicle_id=None):
+    """
+    Caches resolved ids. Call only after the transaction that created them
+    has committed, otherwise a rollback would leave dangling ids in the cache.
+    """
+    if phone_number and user_id is not None:
+        USER_CACHE.put(normalize_phone(phone_number), user_id)
+    if license_plate and vehicle_id is not None:
+        VEHICLE_CACHE.put(normalize_plate(license_plate), vehicle_id)
+
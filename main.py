@@ -2,13 +2,22 @@ from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
+from fastapi.concurrency import run_in_threadpool
 from models import create_tables
 from routes import slots, vehicles
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from seed_data import seed_database
-from routes import registration,free_slot
+from routes import registration,free_slot,sensors,admin
+from routes import reservations as reservation_routes
+import sensor_ingest
+import forecast
+import reservations
+import plate_index
+from admission import AdmissionControl
+from profiler import ProfilerMiddleware
+from database import REQUEST_DB_STATE, REPLICA_DATABASE_URL, current_primary_lsn, parse_lsn
 
 # ✅ Lifespan handles startup and shutdown events
 @asynccontextmanager
@@ -16,8 +25,16 @@ async def lifespan(app: FastAPI):
     print("🚀 Starting up...")
     create_tables()  # Create tables automatically on startup
     seed_database()
+    sensor_ingest.start()
+    forecast.start()
+    reservations.start()
+    plate_index.start()
     yield
     print("🛑 Shutting down...")
+    sensor_ingest.stop()
+    forecast.stop()
+    reservations.stop()
+    plate_index.stop()
 
 # Initialize FastAPI app with lifespan
 app = FastAPI(title="Smart Parking Management System", lifespan=lifespan)
@@ -33,17 +50,20 @@ app.include_router(registration.router, prefix="/register", tags=["Registration"
 app.include_router(slots.router, prefix="/slots", tags=["Slots"])
 app.include_router(vehicles.router, prefix="/vehicles", tags=["Vehicles"])
 app.include_router(free_slot.router)
+app.include_router(sensors.router, prefix="/sensors", tags=["Sensors"])
+app.include_router(admin.router, prefix="/admin", tags=["Admin"])
+app.include_router(reservation_routes.router, prefix="/reservations", tags=["Reservations"])
 
 @app.get("/dashboard", response_class=HTMLResponse)
 def dashboard(request: Request):
     return templates.TemplateResponse("dashboard.html", {"request": request})
 
 # ✅ Serve index.html at home route
-from database import get_db_connection
+from database import get_read_connection, release_read_connection
 
 @app.get("/", response_class=HTMLResponse)
 def read_root(request: Request):
-    conn = get_db_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
     cursor.execute("""
         SELECT s.slot_id, s.is_occupied, v.license_plate, v.vehicle_type, u.user_name
@@ -54,10 +74,29 @@ def read_root(request: Request):
     """)
     slots = cursor.fetchall()
     cursor.close()
-    conn.close()
+    release_read_connection(conn)
     
     return templates.TemplateResponse("index.html", {"request": request, "slots": slots})
 
+# ✅ Read-your-writes: remember where on the primary this client last wrote,
+# so its next reads only go to the replica once it has replayed that far
+@app.middleware("http")
+async def route_reads(request: Request, call_next):
+    state = {"min_lsn": parse_lsn(request.cookies.get("db_lsn"))}
+    token = REQUEST_DB_STATE.set(state)
+    try:
+        response = await call_next(request)
+    finally:
+        REQUEST_DB_STATE.reset(token)
+
+    if REPLICA_DATABASE_URL and state.get("used_primary"):
+        try:
+            lsn = await run_in_threadpool(current_primary_lsn)
+            response.set_cookie("db_lsn", lsn, max_age=300, httponly=True, samesite="lax")
+        except Exception as e:
+            print("⚠️ Could not read primary WAL position:", e)
+    return response
+
 # Enable CORS (important for frontend-backend communication)
 app.add_middleware(
     CORSMiddleware,
@@ -67,6 +106,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Opt-in request profiling (PROFILE_SAMPLE_RATE or an X-Profile header with the api key)
+app.add_middleware(ProfilerMiddleware)
+
+# Shed load before it reaches the DB pool (added last, so it runs first)
+app.add_middleware(AdmissionControl)
+
 # ✅ Run app
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -1,5 +1,7 @@
 import psycopg2
-from database import get_db_connection
+from database import get_db_connection, release_db_connection, LOT_CODE
+from dedupe_identities import dedupe_identities
+from identity import FOLDED_PLATE_SQL
 
 def create_tables():
     conn = get_db_connection()
@@ -22,6 +24,16 @@ def create_tables():
         vehicle_id INTEGER
     );
     """)
+    # Layout attributes, filled in by lot provisioning (provision.py)
+    cursor.execute("""
+    ALTER TABLE slots
+        ADD COLUMN IF NOT EXISTS lot_code VARCHAR(50) NOT NULL DEFAULT %s,
+        ADD COLUMN IF NOT EXISTS level VARCHAR(20),
+        ADD COLUMN IF NOT EXISTS zone VARCHAR(20),
+        ADD COLUMN IF NOT EXISTS slot_code VARCHAR(50),
+        ADD COLUMN IF NOT EXISTS slot_type VARCHAR(50);
+    """, (LOT_CODE,))
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS slots_lot_slot_code_key ON slots (lot_code, slot_code);")
 
     # 3️⃣ Vehicles table with foreign keys
     cursor.execute("""
@@ -48,21 +60,107 @@ def create_tables():
     );
     """)
 
+    # 5️⃣ Occupancy snapshots (history for forecasting)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS occupancy_snapshots (
+        snapshot_id BIGSERIAL PRIMARY KEY,
+        taken_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        lot_code VARCHAR(50) NOT NULL,
+        vehicle_type VARCHAR(50) NOT NULL,
+        occupied INTEGER NOT NULL,
+        capacity INTEGER NOT NULL
+    );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS occupancy_snapshots_taken_at_idx ON occupancy_snapshots (taken_at);")
 
-    #Pre-populate 10 slots if empty
-    cursor.execute("SELECT COUNT(*) FROM slots;")
-    result = cursor.fetchone()
-    # Pre-populate 10 slots if table is empty
-    cursor.execute("SELECT COUNT(*) FROM slots;")
-    result = cursor.fetchone()
-    count = result["count"] if result else 0  # use the column name, not index
+    # 6️⃣ Parking sessions (one row per stay, for exports and history)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS parking_sessions (
+        session_id BIGSERIAL PRIMARY KEY,
+        vehicle_id INTEGER REFERENCES vehicles(vehicle_id) ON DELETE SET NULL,
+        slot_id INTEGER REFERENCES slots(slot_id) ON DELETE SET NULL,
+        license_plate VARCHAR(50),
+        vehicle_type VARCHAR(50),
+        entry_time TIMESTAMPTZ NOT NULL,
+        exit_time TIMESTAMPTZ,
+        amount_due NUMERIC(10, 2)
+    );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS parking_sessions_entry_time_idx ON parking_sessions (entry_time);")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS parking_sessions_open_idx
+        ON parking_sessions (vehicle_id) WHERE exit_time IS NULL;
+    """)
+
+    # One open session per plate; exits by plate (and by OCR-folded plate) use these
+    cursor.execute("SELECT to_regclass('parking_sessions_open_plate_key') IS NOT NULL AS ready;")
+    if not cursor.fetchone()["ready"]:
+        # Older trees could leave a stay open after its slot was freed; keep only the latest
+        cursor.execute("""
+            UPDATE parking_sessions p SET exit_time = now()
+            WHERE p.exit_time IS NULL AND EXISTS (
+                SELECT 1 FROM parking_sessions newer
+                WHERE newer.license_plate = p.license_plate
+                  AND newer.exit_time IS NULL
+                  AND newer.session_id > p.session_id
+            );
+        """)
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS parking_sessions_open_plate_key
+        ON parking_sessions (license_plate) WHERE exit_time IS NULL;
+    """)
+    cursor.execute(f"""
+        CREATE INDEX IF NOT EXISTS parking_sessions_open_folded_plate_idx
+        ON parking_sessions ({FOLDED_PLATE_SQL}) WHERE exit_time IS NULL;
+    """)
 
-    if count == 0:
-        for _ in range(10):
-            cursor.execute(
-                "INSERT INTO slots (is_occupied, vehicle_id) VALUES (FALSE, NULL);"
-            )
+    # 7️⃣ Reservations: no two overlapping bookings of the same slot
+    cursor.execute("CREATE EXTENSION IF NOT EXISTS btree_gist;")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS reservations (
+        reservation_id BIGSERIAL PRIMARY KEY,
+        slot_id INTEGER NOT NULL REFERENCES slots(slot_id) ON DELETE CASCADE,
+        license_plate VARCHAR(50) NOT NULL,
+        phone VARCHAR(20),
+        vehicle_type VARCHAR(50),
+        during TSTZRANGE NOT NULL,
+        created_at TIMESTAMPTZ DEFAULT now(),
+        EXCLUDE USING gist (slot_id WITH =, during WITH &&)
+    );
+    """)
+    cursor.execute("ALTER TABLE reservations ADD COLUMN IF NOT EXISTS cancel_code_hash CHAR(64);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS reservations_created_at_idx ON reservations (created_at);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS reservations_plate_idx ON reservations (license_plate);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS reservations_phone_idx ON reservations (phone);")
+    # Tombstones so every worker's index hears about cancellations
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS reservation_cancellations (
+        reservation_id BIGINT PRIMARY KEY,
+        cancelled_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS reservation_cancellations_at_idx
+        ON reservation_cancellations (cancelled_at);
+    """)
+
+    # 8️⃣ One user per phone, one vehicle per plate (collapse old duplicates first)
+    cursor.execute("SELECT to_regclass('users_phone_key') IS NOT NULL AS ready;")
+    if not cursor.fetchone()["ready"]:
+        counts = dedupe_identities(cursor)
+        print(f"🧹 Deduplicated identities: {counts}")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS users_phone_key ON users (phone);")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS vehicles_license_plate_key ON vehicles (license_plate);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS slots_vehicle_id_idx ON slots (vehicle_id);")
+
+
+    # Pre-populate 10 slots if table is empty (larger sites: python provision.py layout.json)
+    cursor.execute("""
+        INSERT INTO slots (is_occupied, vehicle_id)
+        SELECT FALSE, NULL FROM generate_series(1, 10)
+        WHERE NOT EXISTS (SELECT 1 FROM slots);
+    """)
 
     conn.commit()
     cursor.close()
-    conn.close()
+    release_db_connection(conn)
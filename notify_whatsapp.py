@@ -4,7 +4,8 @@ from datetime import datetime, timedelta, timezone
 import psycopg2.extras
 from dotenv import load_dotenv
 from twilio.rest import Client
-from database import get_db_connection
+from database import get_db_connection, release_db_connection
+from identity import normalize_phone
 
 load_dotenv()
 
@@ -34,43 +35,44 @@ def send_whatsapp_notification(
     """
 
     # --- 1️⃣ Format phone number ---
-    phone_number = phone_number.strip()
-    if not phone_number.startswith("+"):
-        phone_number = "+91" + phone_number  # assume Indian users
-    to_number = f"whatsapp:{phone_number}"
+    to_number = f"whatsapp:{normalize_phone(phone_number)}"
 
     # --- 2️⃣ Reuse token if passed, else create new ---
     token = token_uuid or str(uuid.uuid4())
     expires_at = datetime.now(timezone.utc) + timedelta(hours=2)
 
     # --- 3️⃣ Store token in DB only if new ---
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-
-        # Check if token already exists for this vehicle (avoid duplicates)
-        cursor.execute("""
-            SELECT token_uuid FROM free_tokens
-            WHERE vehicle_id = %s AND used = FALSE
-        """, (vehicle_id,))
-        existing = cursor.fetchone()
+    # A passed token is already stored (UUID) or needs no row at all (signed)
+    if token_uuid is None:
+        conn = None
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
-        if not existing:
+            # Check if token already exists for this vehicle (avoid duplicates)
             cursor.execute("""
-                INSERT INTO free_tokens (token_uuid, vehicle_id, slot_id, expires_at, used)
-                VALUES (%s, %s, %s, %s, FALSE)
-            """, (token, vehicle_id, slot_id, expires_at))
-            conn.commit()
-            print(f"🔑 Token generated and stored: {token}")
-        else:
-            token = existing["token_uuid"]
-            print(f"♻️ Reusing existing token: {token}")
+                SELECT token_uuid FROM free_tokens
+                WHERE vehicle_id = %s AND used = FALSE AND expires_at > now()
+            """, (vehicle_id,))
+            existing = cursor.fetchone()
+
+            if not existing:
+                cursor.execute("""
+                    INSERT INTO free_tokens (token_uuid, vehicle_id, slot_id, expires_at, used)
+                    VALUES (%s, %s, %s, %s, FALSE)
+                """, (token, vehicle_id, slot_id, expires_at))
+                conn.commit()
+                print(f"🔑 Token generated and stored: {token}")
+            else:
+                token = existing["token_uuid"]
+                print(f"♻️ Reusing existing token: {token}")
 
-        cursor.close()
-        conn.close()
-    except Exception as db_error:
-        print(f"❌ Database error while saving token: {db_error}")
-        return
+            cursor.close()
+        except Exception as db_error:
+            print(f"❌ Database error while saving token: {db_error}")
+            return
+        finally:
+            release_db_connection(conn)
 
     # --- 4️⃣ Build link ---
     slot_link = f"{BASE_URL}/slots/free_by_token/{token}"
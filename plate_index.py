@@ -0,0 +1,145 @@
+"""
+Plate → active parking session, for exit gates that only know the plate.
+
+Postgres keeps at most one open session per plate (unique partial index on
+parking_sessions) and indexes the OCR-folded plate of open sessions too, so
+each lookup there is an index probe, not a scan. Each worker also keeps an
+exact plate → session dict, updated as sessions open and close.
+
+Entries are hints, not truth: the exit still closes the session with an
+`exit_time IS NULL` guard, and a stale entry is dropped and looked up again in
+the database. Only exact reads are answered from memory. A worker does not
+know the sessions other workers opened since its last reload, so a fuzzy
+match against its own map could pick the wrong car; fuzzy reads go to the
+database, after its exact lookup, where every open session is visible.
+"""
+import os
+import threading
+from collections import namedtuple
+
+from database import get_read_connection, release_read_connection
+from identity import normalize_plate, fold_plate, FOLDED_PLATE_SQL
+
+PLATE_INDEX_RELOAD_SECONDS = float(os.getenv("PLATE_INDEX_RELOAD_SECONDS", "60"))
+
+ActiveSession = namedtuple("ActiveSession", "session_id vehicle_id slot_id license_plate")
+
+
+class AmbiguousPlate(Exception):
+    """A fuzzy read matches more than one parked vehicle."""
+
+    def __init__(self, candidates):
+        super().__init__(f"plate matches {len(candidates)} parked vehicles")
+        self.candidates = sorted(candidates)
+
+
+class ActivePlateIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.exact = {}        # plate -> ActiveSession
+        self.by_session = {}   # session_id -> plate
+
+    def load(self, rows):
+        with self._lock:
+            self.exact, self.by_session = {}, {}
+            for row in rows:
+                self._add(ActiveSession(row["session_id"], row["vehicle_id"], row["slot_id"], row["license_plate"]))
+
+    def add(self, session: ActiveSession):
+        with self._lock:
+            self._add(session)
+
+    def _add(self, session):
+        plate = normalize_plate(session.license_plate)
+        previous = self.exact.get(plate)
+        if previous:
+            self.by_session.pop(previous.session_id, None)
+        self.exact[plate] = session._replace(license_plate=plate)
+        self.by_session[session.session_id] = plate
+
+    def discard(self, session_id):
+        with self._lock:
+            plate = self.by_session.pop(session_id, None)
+            if plate is not None and self.exact.get(plate, (None,))[0] == session_id:
+                del self.exact[plate]
+
+    def lookup(self, license_plate):
+        """The active session this worker knows for exactly this plate, or None."""
+        with self._lock:
+            return self.exact.get(normalize_plate(license_plate))
+
+    def __len__(self):
+        return len(self.exact)
+
+
+ACTIVE_PLATES = ActivePlateIndex()
+
+_ACTIVE_COLUMNS = "session_id, vehicle_id, slot_id, license_plate"
+
+
+def find_active_session(cursor, license_plate):
+    """
+    The open session for a plate as read by a camera, from the partial indexes
+    on open sessions. An exact match wins; otherwise the read must fold to
+    exactly one parked plate, or AmbiguousPlate is raised.
+    """
+    plate = normalize_plate(license_plate)
+    cursor.execute(
+        f"SELECT {_ACTIVE_COLUMNS} FROM parking_sessions WHERE license_plate = %s AND exit_time IS NULL;",
+        (plate,)
+    )
+    row = cursor.fetchone()
+    if row:
+        return ActiveSession(**row)
+
+    cursor.execute(f"""
+        SELECT {_ACTIVE_COLUMNS} FROM parking_sessions
+        WHERE {FOLDED_PLATE_SQL} = %s AND exit_time IS NULL
+        LIMIT 5;
+    """, (fold_plate(plate),))
+    rows = cursor.fetchall()
+    if len(rows) > 1:
+        raise AmbiguousPlate({row["license_plate"] for row in rows})
+    return ActiveSession(**rows[0]) if rows else None
+
+
+def reload():
+    conn = get_read_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT {_ACTIVE_COLUMNS} FROM parking_sessions WHERE exit_time IS NULL;")
+            rows = cursor.fetchall()
+    finally:
+        release_read_connection(conn)
+    ACTIVE_PLATES.load(rows)
+
+
+_stop = threading.Event()
+_thread = None
+
+
+def _reload_loop():
+    while True:
+        try:
+            reload()
+        except Exception as e:
+            print(f"❌ Plate index reload failed: {e}")
+        if _stop.wait(PLATE_INDEX_RELOAD_SECONDS):
+            break
+
+
+def start():
+    global _thread
+    if _thread:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_reload_loop, name="plate-index", daemon=True)
+    _thread.start()
+
+
+def stop():
+    global _thread
+    _stop.set()
+    if _thread:
+        _thread.join(timeout=5)
+    _thread = None
@@ -0,0 +1,15 @@
+# 💰 Parking tariff, shared by the exit endpoints and the simulator
+
+# ₹ per hour by vehicle type
+RATE_MAP = {"2-wheeler": 30, "4-wheeler": 50, "bicycle": 10}
+DEFAULT_RATE = 10
+
+# Exits via the WhatsApp link are billed for at least 15 minutes
+MIN_BILLABLE_HOURS = 0.25
+
+
+def compute_amount_due(vehicle_type: str, duration_seconds: float, min_hours: float = MIN_BILLABLE_HOURS):
+    """Hourly rate for the vehicle type times hours parked, with a minimum charge."""
+    rate = RATE_MAP.get(vehicle_type, DEFAULT_RATE)
+    billable_hours = max(duration_seconds / 3600, min_hours)
+    return round(billable_hours * rate, 2)
@@ -0,0 +1,228 @@
+"""
+Opt-in sampling profiler for live requests.
+
+A request is profiled when it is picked at random (PROFILE_SAMPLE_RATE) or
+sends `X-Profile: 1` with the admin api key. While at least one profiled
+request is in flight, a sampler thread reads every request thread's stack
+(sys._current_frames) every PROFILE_INTERVAL_MS. When the request finishes,
+its samples are written as collapsed stacks ("a;b;c 42" per line, the input
+of flamegraph.pl and speedscope) to PROFILE_DIR. That directory is a ring
+buffer: only the newest PROFILE_MAX_FILES are kept.
+
+Requests that aren't picked pay for one random() call and a header check.
+Nothing is traced or hooked.
+
+Stacks come from the event-loop thread and the threadpool workers running
+sync handlers. Those threads are shared, so a profile also contains other
+requests that were running at the same time.
+"""
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+
+load_dotenv()
+API_KEY = os.getenv("ADMIN_API_KEY")
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+PROFILE_MAX_CONCURRENT = int(os.getenv("PROFILE_MAX_CONCURRENT", "2"))
+PROFILE_MAX_DEPTH = 128
+
+PROFILE_SUFFIX = ".folded"
+PROFILE_NAME_RE = re.compile(r"^[\w.-]+\.folded$")
+
+# Sync handlers run in the threadpool; only these threads carry request work
+_WORKER_THREAD_PREFIX = "AnyIO worker thread"
+
+
+class Profile:
+    __slots__ = ("name", "stacks", "samples", "started")
+
+    def __init__(self, method, path):
+        slug = re.sub(r"[^\w-]+", "_", path.strip("/"))[:60] or "root"
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")[:-3]  # names sort oldest first
+        self.name = f"{stamp}-{uuid.uuid4().hex[:6]}-{method}-{slug}{PROFILE_SUFFIX}"
+        self.stacks = {}    # collapsed stack -> sample count
+        self.samples = 0
+        self.started = time.perf_counter()
+
+
+class Sampler:
+    """One background thread, idle unless some request is being profiled."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = []
+        self._wake = threading.Event()
+        self._thread = None
+        self._labels = {}           # code object -> frame label
+        self.loop_thread_id = None  # set by the middleware on first use
+
+    def begin(self, profile):
+        with self._lock:
+            if len(self._active) >= PROFILE_MAX_CONCURRENT:
+                return False
+            self._active.append(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return True
+
+    def end(self, profile):
+        with self._lock:
+            self._active.remove(profile)
+
+    def _run(self):
+        interval = PROFILE_INTERVAL_MS / 1000
+        while True:
+            with self._lock:
+                active = list(self._active)
+                if not active:
+                    self._wake.clear()
+            if not active:
+                self._wake.wait()
+                continue
+            stacks = self._sample()
+            with self._lock:
+                for profile in active:
+                    profile.samples += 1
+                    for stack in stacks:
+                        profile.stacks[stack] = profile.stacks.get(stack, 0) + 1
+            time.sleep(interval)
+
+    def _sample(self):
+        request_threads = {
+            t.ident for t in threading.enumerate() if t.name.startswith(_WORKER_THREAD_PREFIX)
+        }
+        request_threads.add(self.loop_thread_id)
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id not in request_threads:
+                continue
+            labels = []
+            in_app = False
+            while frame is not None and len(labels) < PROFILE_MAX_DEPTH:
+                label, is_app = self._label(frame.f_code)
+                labels.append(label)
+                in_app = in_app or is_app
+                frame = frame.f_back
+            # Threads parked in the event loop or the pool's queue have no app frames
+            if in_app:
+                stacks.append(";".join(reversed(labels)))
+        return stacks
+
+    def _label(self, code):
+        cached = self._labels.get(code)
+        if cached is None:
+            filename = code.co_filename
+            is_app = filename.startswith(_APP_ROOT) and "site-packages" not in filename
+            # `python main.py` leaves main.py's module frame under the idle event loop
+            is_app = is_app and code.co_name != "<module>"
+            where = os.path.relpath(filename, _APP_ROOT) if filename.startswith(_APP_ROOT) else os.path.basename(filename)
+            cached = self._labels[code] = (f"{code.co_name} ({where}:{code.co_firstlineno})", is_app)
+        return cached
+
+
+_APP_ROOT = os.path.dirname(os.path.abspath(__file__)) + os.sep
+SAMPLER = Sampler()
+
+
+# ------------------ Ring buffer on disk ------------------
+def write_profile(profile, duration_ms):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, profile.name)
+    with open(path + ".tmp", "w") as f:
+        for stack, count in sorted(profile.stacks.items()):
+            f.write(f"{stack} {count}\n")
+    os.replace(path + ".tmp", path)
+    print(f"🔬 Profiled {profile.name}: {duration_ms:.0f} ms, {profile.samples} samples")
+
+    names = sorted(n for n in os.listdir(PROFILE_DIR) if n.endswith(PROFILE_SUFFIX))
+    for old in names[:max(0, len(names) - PROFILE_MAX_FILES)]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, old))
+        except FileNotFoundError:
+            pass
+
+
+def list_profiles():
+    """Newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for entry in os.scandir(PROFILE_DIR):
+        if entry.name.endswith(PROFILE_SUFFIX):
+            stat = entry.stat()
+            profiles.append({
+                "name": entry.name,
+                "bytes": stat.st_size,
+                "created": datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat(),
+            })
+    return sorted(profiles, key=lambda p: p["name"], reverse=True)
+
+
+def profile_path(name):
+    """Path of a stored profile, or None for unknown or unsafe names."""
+    if not PROFILE_NAME_RE.match(name):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+# ------------------ Middleware ------------------
+class ProfilerMiddleware:
+    """Pure ASGI middleware; unsampled requests pass straight through."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            return await self.app(scope, receive, send)
+
+        if SAMPLER.loop_thread_id is None:
+            SAMPLER.loop_thread_id = threading.get_ident()
+        profile = Profile(scope["method"], scope["path"])
+        if not SAMPLER.begin(profile):
+            return await self.app(scope, receive, send)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile.name.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            SAMPLER.end(profile)
+            duration_ms = (time.perf_counter() - profile.started) * 1000
+            try:
+                await run_in_threadpool(write_profile, profile, duration_ms)
+            except OSError as e:
+                print("⚠️ Could not write profile:", e)
+
+    @staticmethod
+    def _wanted(scope):
+        if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+            return True
+        if not API_KEY:
+            return False
+        headers = scope.get("headers") or ()
+        requested = key = None
+        for name, value in headers:
+            if name == b"x-profile":
+                requested = value
+            elif name in (b"api-key", b"api_key"):
+                key = value
+        return requested not in (None, b"0") and key is not None and key.decode() == API_KEY
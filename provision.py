@@ -0,0 +1,167 @@
+"""
+Bulk lot provisioning: loads a site layout into slots with one COPY and one
+set-based upsert, so a 20,000-slot multi-storey site takes seconds.
+Re-running the same layout changes nothing (slots are keyed by lot + slot code).
+
+Layouts are CSV with a header row:
+    lot_code,level,zone,slot_code,slot_type
+    MALL1,B1,A,B1-A-001,4-wheeler
+
+or JSON, listing slot codes or just a count per zone:
+    {"lot_code": "MALL1", "levels": [
+        {"level": "B1", "zones": [
+            {"zone": "A", "slots": 250, "slot_type": "4-wheeler"},
+            {"zone": "M", "slot_codes": ["B1-M-01", "B1-M-02"], "slot_type": "2-wheeler"}
+        ]}
+    ]}
+
+    python provision.py mall1.json
+"""
+import csv
+import io
+import json
+import sys
+import time
+
+from database import get_db_connection, release_db_connection
+
+LAYOUT_COLUMNS = ("lot_code", "level", "zone", "slot_code", "slot_type")
+
+
+def parse_layout(text: str, fmt: str):
+    """Returns a list of (lot_code, level, zone, slot_code, slot_type) tuples."""
+    if fmt == "json":
+        return _parse_json_layout(json.loads(text))
+    if fmt == "csv":
+        return _parse_csv_layout(text)
+    raise ValueError(f"Unknown layout format: {fmt}")
+
+
+def _parse_csv_layout(text):
+    rows = []
+    for line_no, record in enumerate(csv.DictReader(io.StringIO(text)), start=2):
+        if not record.get("lot_code") or not record.get("slot_code"):
+            raise ValueError(f"Line {line_no}: lot_code and slot_code are required")
+        rows.append(tuple((record.get(col) or "").strip() or None for col in LAYOUT_COLUMNS))
+    return rows
+
+
+def _parse_json_layout(layout):
+    if not isinstance(layout, dict):
+        raise ValueError("Layout must be a JSON object")
+    lot_code = layout.get("lot_code")
+    if not lot_code or not isinstance(lot_code, str):
+        raise ValueError("Layout needs a lot_code")
+
+    rows = []
+    for level in _json_list(layout, "levels", "layout"):
+        if not isinstance(level, dict) or level.get("level") is None:
+            raise ValueError("Each level needs a level name")
+        level_name = str(level["level"])
+        for zone in _json_list(level, "zones", f"level {level_name}"):
+            if not isinstance(zone, dict) or zone.get("zone") is None:
+                raise ValueError(f"Each zone in level {level_name} needs a zone name")
+            zone_name = str(zone["zone"])
+            where = f"zone {level_name}/{zone_name}"
+            slot_type = zone.get("slot_type")
+            if slot_type is not None and not isinstance(slot_type, str):
+                raise ValueError(f"{where}: slot_type must be a string")
+            count = zone.get("slots", 0)
+            if isinstance(count, bool) or not isinstance(count, int) or count < 0:
+                raise ValueError(f"{where}: slots must be a non-negative integer")
+            codes = _json_list(zone, "slot_codes", where) or [
+                f"{level_name}-{zone_name}-{n:03d}" for n in range(1, count + 1)
+            ]
+            rows.extend((lot_code, level_name, zone_name, str(code), slot_type) for code in codes)
+    return rows
+
+
+def _json_list(obj, key, where):
+    value = obj.get(key)
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        raise ValueError(f"{where}: {key} must be a list")
+    return value
+
+
+def provision_layout(rows):
+    """
+    COPYs the layout into a temp staging table and upserts it into slots in
+    one statement. Returns counts and per-phase timings in milliseconds.
+    """
+    timings = {}
+    started = time.perf_counter()
+
+    buf = io.StringIO()
+    csv.writer(buf).writerows(rows)
+    buf.seek(0)
+
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                CREATE TEMP TABLE lot_staging (
+                    lot_code VARCHAR(50),
+                    level VARCHAR(20),
+                    zone VARCHAR(20),
+                    slot_code VARCHAR(50),
+                    slot_type VARCHAR(50)
+                ) ON COMMIT DROP;
+            """)
+            step = time.perf_counter()
+            cursor.copy_expert(f"COPY lot_staging ({', '.join(LAYOUT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buf)
+            timings["copy_ms"] = round((time.perf_counter() - step) * 1000, 1)
+
+            step = time.perf_counter()
+            cursor.execute("""
+                WITH merged AS (
+                    INSERT INTO slots (lot_code, level, zone, slot_code, slot_type, is_occupied)
+                    SELECT DISTINCT ON (lot_code, slot_code) lot_code, level, zone, slot_code, slot_type, FALSE
+                    FROM lot_staging
+                    ORDER BY lot_code, slot_code
+                    ON CONFLICT (lot_code, slot_code) DO UPDATE SET
+                        level = EXCLUDED.level,
+                        zone = EXCLUDED.zone,
+                        slot_type = EXCLUDED.slot_type
+                    WHERE (slots.level, slots.zone, slots.slot_type)
+                          IS DISTINCT FROM (EXCLUDED.level, EXCLUDED.zone, EXCLUDED.slot_type)
+                    RETURNING (xmax = 0) AS inserted
+                )
+                SELECT COUNT(*) FILTER (WHERE inserted) AS inserted,
+                       COUNT(*) FILTER (WHERE NOT inserted) AS updated
+                FROM merged;
+            """)
+            counts = cursor.fetchone()
+            timings["merge_ms"] = round((time.perf_counter() - step) * 1000, 1)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+    timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    inserted, updated = counts["inserted"], counts["updated"]
+    distinct = len({(row[0], row[3]) for row in rows})
+    return {
+        "slots_in_layout": distinct,
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": distinct - inserted - updated,
+        "timings": timings,
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python provision.py <layout.csv|layout.json>")
+        sys.exit(1)
+
+    path = sys.argv[1]
+    with open(path) as f:
+        layout_rows = parse_layout(f.read(), "json" if path.endswith(".json") else "csv")
+    result = provision_layout(layout_rows)
+    print(f"🏗️  {result['slots_in_layout']} slots in layout: {result['inserted']} added, "
+          f"{result['updated']} updated, {result['unchanged']} unchanged "
+          f"in {result['timings']['total_ms']} ms")
@@ -0,0 +1,360 @@
+"""
+Advance reservations.
+
+Postgres is the source of truth: reservations.during is a tstzrange and an
+exclusion constraint rejects overlapping bookings of the same slot. Each
+worker also keeps an in-memory interval index per lot so conflict and
+availability checks don't scan bookings.
+
+The exclusion constraint keeps one slot's bookings disjoint, so sorting them
+by start also sorts them by end. That makes two sorted arrays plus a binary
+search enough to answer "does [a, b) overlap anything on this slot?" in
+O(log n) for n bookings of that slot. Listing free slots walks the lot in
+slot order and stops after `limit` hits, so it also pays for every booked slot
+it passes. The booking-share check doesn't look at slots at all: each lot keeps
+a count of bookings per BOOKING_BUCKET_SECONDS, and the peak over a window
+costs one lookup per bucket.
+"""
+import hashlib
+import os
+import secrets
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+
+from database import get_read_connection, release_read_connection
+from identity import normalize_plate
+
+# Walk-ins won't be given a slot that is booked to start within this window
+RESERVATION_HOLD_MINUTES = int(os.getenv("RESERVATION_HOLD_MINUTES", "120"))
+# A booking can be claimed this early
+RESERVATION_GRACE_MINUTES = int(os.getenv("RESERVATION_GRACE_MINUTES", "30"))
+# How often workers pick up bookings and cancellations made by other workers, and fully reload
+RESERVATION_SYNC_SECONDS = float(os.getenv("RESERVATION_SYNC_SECONDS", "5"))
+RESERVATION_RELOAD_SECONDS = float(os.getenv("RESERVATION_RELOAD_SECONDS", "600"))
+# Limits on public booking: live bookings per plate and per phone, and the
+# share of a lot's slots that may be booked for any one window
+RESERVATION_MAX_PER_PLATE = int(os.getenv("RESERVATION_MAX_PER_PLATE", "2"))
+RESERVATION_MAX_PER_PHONE = int(os.getenv("RESERVATION_MAX_PER_PHONE", "3"))
+RESERVATION_MAX_SHARE = float(os.getenv("RESERVATION_MAX_SHARE", "0.5"))
+# Each sync looks back this far past the previous one, so bookings whose transaction
+# started earlier (created_at is the start time) but committed later are not missed
+RESERVATION_SYNC_OVERLAP_SECONDS = float(os.getenv("RESERVATION_SYNC_OVERLAP_SECONDS", "60"))
+
+# Granularity of the per-lot booking counts behind peak_booked
+BOOKING_BUCKET_SECONDS = 900
+
+
+class SlotIntervals:
+    """Disjoint [start, end) bookings of one slot, sorted, as epoch seconds."""
+
+    __slots__ = ("starts", "ends", "ids")
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.ids = []
+
+    def overlaps(self, start, end):
+        # First booking that ends after `start`; it conflicts if it begins before `end`
+        i = bisect_right(self.ends, start)
+        return i < len(self.starts) and self.starts[i] < end
+
+    def add(self, start, end, reservation_id):
+        i = bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.ids.insert(i, reservation_id)
+
+    def remove(self, start, reservation_id):
+        i = bisect_left(self.starts, start)
+        while i < len(self.starts) and self.starts[i] == start:
+            if self.ids[i] == reservation_id:
+                del self.starts[i], self.ends[i], self.ids[i]
+                return True
+            i += 1
+        return False
+
+
+class ReservationIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.slots = {}          # slot_id -> SlotIntervals
+        self.lot_slots = {}      # lot_code -> [(slot_id, slot_type)] in slot_id order
+        self.lot_of = {}         # slot_id -> lot_code
+        self.lot_buckets = {}    # lot_code -> {bucket: bookings touching it}
+        self.by_id = {}          # reservation_id -> (slot_id, start, end, plate)
+        self.by_plate = {}       # normalised plate -> {reservation_id}
+
+    # ---- loading ----
+    def load(self, slot_rows, reservation_rows):
+        with self._lock:
+            self._reset()
+            self.set_slots(slot_rows)
+            for row in reservation_rows:
+                self.add(row)
+
+    def set_slots(self, slot_rows):
+        with self._lock:
+            lot_slots = {}
+            for row in slot_rows:
+                lot_slots.setdefault(row["lot_code"], []).append((row["slot_id"], row["slot_type"]))
+            self.lot_slots = lot_slots
+            self.lot_of = {slot_id: lot for lot, slots in lot_slots.items() for slot_id, _ in slots}
+            self.lot_buckets = {}
+            for slot_id, start, end, _ in self.by_id.values():
+                self._count(slot_id, start, end, 1)
+
+    def add(self, row):
+        """row: reservation_id, slot_id, license_plate, starts_at, ends_at."""
+        self.add_interval(row["reservation_id"], row["slot_id"], row["license_plate"],
+                          row["starts_at"].timestamp(), row["ends_at"].timestamp())
+
+    def add_interval(self, reservation_id, slot_id, license_plate, start, end):
+        plate = normalize_plate(license_plate)
+        with self._lock:
+            if reservation_id in self.by_id:
+                return
+            self.slots.setdefault(slot_id, SlotIntervals()).add(start, end, reservation_id)
+            self.by_id[reservation_id] = (slot_id, start, end, plate)
+            self.by_plate.setdefault(plate, set()).add(reservation_id)
+            self._count(slot_id, start, end, 1)
+
+    def remove(self, reservation_id):
+        with self._lock:
+            entry = self.by_id.pop(reservation_id, None)
+            if not entry:
+                return
+            slot_id, start, end, plate = entry
+            self.slots[slot_id].remove(start, reservation_id)
+            self.by_plate.get(plate, set()).discard(reservation_id)
+            self._count(slot_id, start, end, -1)
+
+    def _count(self, slot_id, start, end, delta):
+        lot = self.lot_of.get(slot_id)
+        if lot is None:
+            return
+        buckets = self.lot_buckets.setdefault(lot, {})
+        for bucket in range(*_bucket_range(start, end)):
+            buckets[bucket] = buckets.get(bucket, 0) + delta
+            if not buckets[bucket]:
+                del buckets[bucket]
+
+    # ---- queries (times are epoch seconds) ----
+    def is_free(self, slot_id, start, end):
+        with self._lock:
+            intervals = self.slots.get(slot_id)
+            return intervals is None or not intervals.overlaps(start, end)
+
+    def free_slots(self, lot, start, end, vehicle_type=None, limit=10):
+        """First `limit` slots in the lot (slot_id order) with no booking overlapping [start, end)."""
+        found = []
+        with self._lock:
+            for slot_id, slot_type in self.lot_slots.get(lot, ()):
+                if vehicle_type and slot_type and slot_type != vehicle_type:
+                    continue
+                intervals = self.slots.get(slot_id)
+                if intervals is None or not intervals.overlaps(start, end):
+                    found.append(slot_id)
+                    if len(found) >= limit:
+                        break
+        return found
+
+    def peak_booked(self, lot, start, end):
+        """
+        Most of the lot's bookings running at once during [start, end), per
+        BOOKING_BUCKET_SECONDS. Two bookings that meet inside one bucket both
+        count there, so this errs high by at most the bookings changing over.
+        """
+        with self._lock:
+            buckets = self.lot_buckets.get(lot)
+            if not buckets:
+                return 0
+            return max(buckets.get(bucket, 0) for bucket in range(*_bucket_range(start, end)))
+
+    def reservation_for(self, license_plate, t):
+        """(reservation_id, slot_id) of the plate's booking that is claimable at `t`, if any."""
+        grace = RESERVATION_GRACE_MINUTES * 60
+        with self._lock:
+            for reservation_id in self.by_plate.get(normalize_plate(license_plate), ()):
+                slot_id, start, end, _ = self.by_id[reservation_id]
+                if start - grace <= t < end:
+                    return reservation_id, slot_id
+        return None
+
+
+def _bucket_range(start, end):
+    """Buckets touched by [start, end), as range() arguments."""
+    first = int(start // BOOKING_BUCKET_SECONDS)
+    last = int(-(-end // BOOKING_BUCKET_SECONDS))  # rounded up
+    return first, max(last, first + 1)
+
+
+RESERVATIONS = ReservationIndex()
+
+
+# ------------------ Cancel codes ------------------
+def new_cancel_code():
+    """A random code handed to whoever booked; only its hash is stored."""
+    code = secrets.token_urlsafe(12)
+    return code, hash_cancel_code(code)
+
+
+def hash_cancel_code(code: str) -> str:
+    return hashlib.sha256(code.encode()).hexdigest()
+
+
+# ------------------ Allocation ------------------
+def choose_slot(index, license_plate, now, vacant_slots, is_vacant):
+    """
+    The allocation rule, shared by registration and simulator.py. A vehicle
+    arriving at `now` (epoch seconds) gets its own booked slot if it has one
+    and it is vacant, otherwise the lowest vacant slot not booked within the
+    hold window. `vacant_slots` yields vacant slot ids in slot_id order and is
+    only consumed as far as needed; `is_vacant(slot_id)` checks a single slot.
+    """
+    if license_plate:
+        own = index.reservation_for(license_plate, now)
+        if own and is_vacant(own[1]):
+            return own[1]
+
+    hold_until = now + RESERVATION_HOLD_MINUTES * 60
+    for slot_id in vacant_slots:
+        if index.is_free(slot_id, now, hold_until):
+            return slot_id
+    return None
+
+
+def pick_vacant_slot(cursor, license_plate, now=None):
+    """Slot for a vehicle arriving now (see choose_slot), from the slots table."""
+    now = now or datetime.now(timezone.utc)
+
+    def vacant_slots():
+        offset = 0
+        while True:
+            cursor.execute("""
+                SELECT slot_id FROM slots
+                WHERE is_occupied = FALSE
+                ORDER BY slot_id LIMIT 50 OFFSET %s;
+            """, (offset,))
+            rows = cursor.fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row["slot_id"] if isinstance(row, dict) else row[0]
+            offset += len(rows)
+
+    def is_vacant(slot_id):
+        cursor.execute("SELECT slot_id FROM slots WHERE slot_id = %s AND is_occupied = FALSE;", (slot_id,))
+        return cursor.fetchone() is not None
+
+    return choose_slot(RESERVATIONS, license_plate, now.timestamp(), vacant_slots(), is_vacant)
+
+
+# ------------------ Sync with the database ------------------
+_RESERVATION_COLUMNS = """
+    reservation_id, slot_id, license_plate, lower(during) AS starts_at, upper(during) AS ends_at
+"""
+
+
+# Database time of the last reload/sync; the next sync starts from here
+_synced_at = None
+
+
+def reload():
+    """Full reload of slots and current/future bookings."""
+    global _synced_at
+    conn = get_read_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT now() AS synced_at;")
+            synced_at = cursor.fetchone()["synced_at"]
+            cursor.execute("SELECT slot_id, lot_code, slot_type FROM slots ORDER BY slot_id;")
+            slot_rows = cursor.fetchall()
+            cursor.execute(f"""
+                SELECT {_RESERVATION_COLUMNS} FROM reservations
+                WHERE upper(during) > now()
+                ORDER BY slot_id, lower(during);
+            """)
+            reservation_rows = cursor.fetchall()
+    finally:
+        release_read_connection(conn)
+    RESERVATIONS.load(slot_rows, reservation_rows)
+    _synced_at = synced_at
+
+
+def sync_changes():
+    """
+    Applies bookings and cancellations made (by any worker) since the last
+    sync. Bookings are found by created_at, cancellations by the tombstones
+    in reservation_cancellations; both look back RESERVATION_SYNC_OVERLAP_SECONDS
+    further, and re-applying either is harmless.
+    """
+    global _synced_at
+    if _synced_at is None:
+        return reload()
+
+    since = _synced_at - timedelta(seconds=RESERVATION_SYNC_OVERLAP_SECONDS)
+    conn = get_read_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT now() AS synced_at;")
+            synced_at = cursor.fetchone()["synced_at"]
+            cursor.execute(f"""
+                SELECT {_RESERVATION_COLUMNS} FROM reservations
+                WHERE created_at > %s AND upper(during) > now();
+            """, (since,))
+            added = cursor.fetchall()
+            cursor.execute(
+                "SELECT reservation_id FROM reservation_cancellations WHERE cancelled_at > %s;",
+                (since,)
+            )
+            cancelled = cursor.fetchall()
+    finally:
+        release_read_connection(conn)
+
+    for row in added:
+        RESERVATIONS.add(row)
+    for row in cancelled:
+        RESERVATIONS.remove(row["reservation_id"])
+    _synced_at = synced_at
+
+
+_stop = threading.Event()
+_thread = None
+
+
+def _sync_loop():
+    last_reload = 0.0
+    while True:
+        try:
+            if time.monotonic() - last_reload >= RESERVATION_RELOAD_SECONDS:
+                reload()
+                last_reload = time.monotonic()
+            else:
+                sync_changes()
+        except Exception as e:
+            print(f"❌ Reservation sync failed: {e}")
+        if _stop.wait(RESERVATION_SYNC_SECONDS):
+            break
+
+
+def start():
+    global _thread
+    if _thread:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_sync_loop, name="reservation-sync", daemon=True)
+    _thread.start()
+
+
+def stop():
+    global _thread
+    _stop.set()
+    if _thread:
+        _thread.join(timeout=5)
+    _thread = None
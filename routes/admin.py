@@ -0,0 +1,110 @@
+# routes/admin.py
+from fastapi import APIRouter, HTTPException, Header, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, FileResponse
+import os
+from dotenv import load_dotenv
+from export import export_sessions, month_range, EXPORT_FETCH_SIZE, EXPORT_MAX_FETCH_SIZE
+from provision import parse_layout, provision_layout
+from admission import admission_stats
+import reservations
+from profiler import list_profiles, profile_path
+
+load_dotenv()
+API_KEY = os.getenv("ADMIN_API_KEY")
+
+router = APIRouter()
+
+
+# ------------------ EXPORT SESSIONS ------------------
+@router.get("/export/sessions")
+def export_sessions_dump(
+    month: str,
+    format: str = "csv",
+    gzip: bool = False,
+    fetch_size: int = EXPORT_FETCH_SIZE,
+    api_key: str = Header(None)
+):
+    """Streams a month of parking sessions as CSV (optionally gzipped) or Parquet."""
+    if api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    if format not in ("csv", "parquet"):
+        raise HTTPException(status_code=400, detail="format must be csv or parquet")
+    if format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=501, detail="Parquet export needs pyarrow installed")
+    try:
+        start, end = month_range(month)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="month must look like 2026-09")
+
+    if format == "parquet":
+        filename, media_type = f"sessions-{month}.parquet", "application/vnd.apache.parquet"
+    elif gzip:
+        filename, media_type = f"sessions-{month}.csv.gz", "application/gzip"
+    else:
+        filename, media_type = f"sessions-{month}.csv", "text/csv"
+
+    return StreamingResponse(
+        export_sessions(start, end, format, gzip, min(max(fetch_size, 1), EXPORT_MAX_FETCH_SIZE)),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+# ------------------ PROVISION LOT LAYOUT ------------------
+@router.post("/lots/provision")
+async def provision_lot(request: Request, format: str = "json", api_key: str = Header(None)):
+    """
+    Loads a lot layout (JSON or CSV request body, see provision.py) into slots.
+    Safe to repeat: existing slots are matched by lot_code + slot_code.
+    """
+    if api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    body = await request.body()
+    try:
+        rows = parse_layout(body.decode(), format)
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid layout: {e}")
+    if not rows:
+        raise HTTPException(status_code=400, detail="Layout has no slots")
+
+    result = await run_in_threadpool(provision_layout, rows)
+    # New slots become bookable here at once (other workers pick them up on their next full reload)
+    try:
+        await run_in_threadpool(reservations.reload)
+    except Exception as e:
+        print("⚠️ Could not reload reservation index:", e)
+    return result
+
+
+# ------------------ ADMISSION COUNTERS ------------------
+@router.get("/admission")
+def get_admission_stats(api_key: str = Header(None)):
+    """Admitted/shed counts per reason and current in-flight requests."""
+    if api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return admission_stats()
+
+
+# ------------------ REQUEST PROFILES ------------------
+@router.get("/profiles")
+def get_profiles(api_key: str = Header(None)):
+    """Stored request profiles (collapsed stacks), newest first."""
+    if api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return list_profiles()
+
+
+@router.get("/profiles/{name}")
+def download_profile(name: str, api_key: str = Header(None)):
+    """One profile, ready for flamegraph.pl or speedscope."""
+    if api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    path = profile_path(name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=name)
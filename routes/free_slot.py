@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
-from database import get_db_connection
-from datetime import datetime, timezone
+from database import get_db_connection, release_db_connection
+from datetime import datetime, timedelta, timezone
+from pricing import compute_amount_due
+from sessions import end_stay
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
@@ -12,37 +14,43 @@ def free_slot(vehicle_id: int, request: Request):
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    # 1️⃣ Get slot, entry time, and vehicle info
-    cursor.execute("""
-        SELECT v.license_plate, v.entry_time, v.vehicle_type, s.slot_id
-        FROM vehicles v
-        JOIN slots s ON s.vehicle_id = v.vehicle_id
-        WHERE v.vehicle_id = %s;
-    """, (vehicle_id,))
-    data = cursor.fetchone()
-
-    if not data:
-        return HTMLResponse("<h3>❌ Invalid or expired link.</h3>")
-
-    license_plate, entry_time, vehicle_type, slot_id = data
-
-    # 2️⃣ Compute exit details
-    exit_time = datetime.now()
-    duration = exit_time - entry_time
-    total_minutes = int(duration.total_seconds() / 60)
-    hours = total_minutes / 60
-
-    # 💰 Basic pricing logic
-    rate_per_hour = 30 if vehicle_type == "4-wheeler" else 15
-    amount = max(rate_per_hour * round(hours, 2), rate_per_hour)  # minimum 1 hour charge
-
-    # 3️⃣ Update DB
-    cursor.execute("UPDATE slots SET is_occupied = FALSE, vehicle_id = NULL WHERE slot_id = %s;", (slot_id,))
-    cursor.execute("UPDATE vehicles SET exit_time = %s WHERE vehicle_id = %s;", (exit_time, vehicle_id))
-
-    conn.commit()
-    cursor.close()
-    conn.close()
+    try:
+        # 1️⃣ Get slot, entry time, and vehicle info
+        cursor.execute("""
+            SELECT v.license_plate, v.entry_time, v.vehicle_type, s.slot_id
+            FROM vehicles v
+            JOIN slots s ON s.vehicle_id = v.vehicle_id
+            WHERE v.vehicle_id = %s;
+        """, (vehicle_id,))
+        data = cursor.fetchone()
+
+        if not data:
+            return HTMLResponse("<h3>❌ Invalid or expired link.</h3>")
+
+        license_plate, vehicle_type, slot_id = data["license_plate"], data["vehicle_type"], data["slot_id"]
+
+        # 2️⃣ Update DB: free the slot and end (and bill) the parking session
+        exit_time = datetime.now(timezone.utc)
+        cursor.execute("UPDATE slots SET is_occupied = FALSE, vehicle_id = NULL WHERE slot_id = %s AND vehicle_id = %s;",
+                       (slot_id, vehicle_id))
+        cursor.execute("UPDATE vehicles SET parked_slot = NULL, entry_time = NULL WHERE vehicle_id = %s;", (vehicle_id,))
+        session, amount = end_stay(cursor, vehicle_id, exit_time)
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+    # 3️⃣ Compute exit details
+    entry_time = session["entry_time"] if session else data["entry_time"]
+    if entry_time and entry_time.tzinfo is None:
+        entry_time = entry_time.replace(tzinfo=timezone.utc)
+    duration = exit_time - entry_time if entry_time else timedelta(0)
+    if amount is None:  # parked before sessions were recorded
+        amount = compute_amount_due(vehicle_type, duration.total_seconds())
 
     # 4️⃣ Show exit summary
     return templates.TemplateResponse(
@@ -2,9 +2,13 @@
 from fastapi import APIRouter, Form, HTTPException, BackgroundTasks, Request
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
-from database import get_db_connection
+from database import get_db_connection, release_db_connection
 import os
 from notify_whatsapp import send_whatsapp_notification
+from identity import resolve_user, resolve_vehicle, remember_identity
+from sessions import open_session
+from exit_tokens import signing_enabled, make_token
+from reservations import pick_vacant_slot
 from datetime import datetime, timedelta, timezone
 import uuid
 
@@ -32,37 +36,23 @@ def register_vehicle(
     cursor = conn.cursor()
 
     try:
-        # 1️⃣ Find first available slot
-        cursor.execute("""
-            SELECT slot_id FROM slots 
-            WHERE is_occupied = FALSE 
-            ORDER BY slot_id LIMIT 1;
-        """)
-        slot = cursor.fetchone()
-        if not slot:
+        # 1️⃣ Find a slot: the vehicle's booked one, else the first vacant slot not about to be claimed by a booking
+        slot_id = pick_vacant_slot(cursor, license_plate)
+        if not slot_id:
             return HTMLResponse("<h3>⚠️ No vacant slots available!</h3>")
 
-        slot_id = slot['slot_id'] if isinstance(slot, dict) else slot[0]
+        # 2️⃣ Look up (or create) the user by phone number
+        user_id = resolve_user(cursor, user_name, phone_number)
 
-        # 2️⃣ Insert user record
-        cursor.execute("""
-            INSERT INTO users (user_name, phone) 
-            VALUES (%s, %s) 
-            RETURNING user_id;
-        """, (user_name, phone_number))
-        user_row = cursor.fetchone()
-        user_id = user_row["user_id"] if isinstance(user_row, dict) else user_row[0]
-
-        # 3️⃣ Insert vehicle record
+        # 3️⃣ Look up (or create) the vehicle by plate and start its stay
         entry_time = datetime.now(timezone.utc)
-        cursor.execute("""
-            INSERT INTO vehicles (
-                license_plate, user_id, parked_slot, vehicle_type, phone_number, entry_time
-            ) VALUES (%s, %s, %s, %s, %s, %s)
-            RETURNING vehicle_id;
-        """, (license_plate, user_id, slot_id, vehicle_type, phone_number, entry_time))
-        vehicle_row = cursor.fetchone()
-        vehicle_id = vehicle_row["vehicle_id"] if isinstance(vehicle_row, dict) else vehicle_row[0]
+        vehicle_id = resolve_vehicle(
+            cursor, license_plate, user_id, vehicle_type, phone_number,
+            parked_slot=slot_id, entry_time=entry_time
+        )
+        if vehicle_id is None:
+            conn.rollback()
+            return HTMLResponse("<h3>⚠️ This vehicle is already parked. Please free its slot first.</h3>", status_code=409)
 
         # 4️⃣ Mark slot as occupied
         cursor.execute("""
@@ -70,15 +60,19 @@ def register_vehicle(
             SET is_occupied = TRUE, vehicle_id = %s 
             WHERE slot_id = %s;
         """, (vehicle_id, slot_id))
+        session_id = open_session(cursor, vehicle_id, slot_id, entry_time)
 
-        # 5️⃣ Create free-token (for exit link)
-        token_uuid = str(uuid.uuid4())
-        expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
+        # 5️⃣ Create free-token (for exit link): signed and stateless when a secret is set
+        if signing_enabled():
+            token_uuid = make_token(vehicle_id, slot_id, session_id)
+        else:
+            token_uuid = str(uuid.uuid4())
+            expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
 
-        cursor.execute("""
-            INSERT INTO free_tokens (token_uuid, vehicle_id, slot_id, expires_at, used)
-            VALUES (%s, %s, %s, %s, FALSE);
-        """, (token_uuid, vehicle_id, slot_id, expires_at))
+            cursor.execute("""
+                INSERT INTO free_tokens (token_uuid, vehicle_id, slot_id, expires_at, used)
+                VALUES (%s, %s, %s, %s, FALSE);
+            """, (token_uuid, vehicle_id, slot_id, expires_at))
 
         # ✅ Build the WhatsApp free-slot link
         BASE_URL = os.getenv("BASE_URL", "https://your-app.onrender.com")
@@ -86,6 +80,7 @@ def register_vehicle(
 
         # Commit DB changes
         conn.commit()
+        remember_identity(phone_number, user_id, license_plate, vehicle_id)
 
         # 6️⃣ Send WhatsApp notification asynchronously
         background_tasks.add_task(
@@ -116,5 +111,5 @@ def register_vehicle(
         raise HTTPException(status_code=500, detail=f"Internal Server Error: {e}")
     finally:
         cursor.close()
-        conn.close()
+        release_db_connection(conn)
 
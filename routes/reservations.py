@@ -0,0 +1,156 @@
+# routes/reservations.py
+from fastapi import APIRouter, HTTPException, Header
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+import psycopg2.errors
+from database import get_db_connection, release_db_connection, LOT_CODE
+from forecast import FORECAST_TZ
+from identity import normalize_plate, normalize_phone
+from reservations import (
+    RESERVATIONS, RESERVATION_MAX_PER_PLATE, RESERVATION_MAX_PER_PHONE, RESERVATION_MAX_SHARE,
+    new_cancel_code, hash_cancel_code,
+)
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+API_KEY = os.getenv("ADMIN_API_KEY")
+
+router = APIRouter()
+
+
+def _as_aware(value: datetime):
+    """Times without an offset are lot-local."""
+    return value.replace(tzinfo=ZoneInfo(FORECAST_TZ)) if value.tzinfo is None else value
+
+
+def _check_window(start: datetime, end: datetime):
+    start, end = _as_aware(start), _as_aware(end)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if end <= datetime.now(timezone.utc):
+        raise HTTPException(status_code=400, detail="Window is in the past")
+    return start, end
+
+
+# ------------------ AVAILABILITY ------------------
+@router.get("/availability")
+def get_availability(start: datetime, end: datetime, vehicle_type: str = None, lot: str = LOT_CODE, limit: int = 10):
+    """Slots with no booking overlapping [start, end), answered from the in-memory index."""
+    start, end = _check_window(start, end)
+    slots = RESERVATIONS.free_slots(lot, start.timestamp(), end.timestamp(), vehicle_type, limit=max(1, min(limit, 100)))
+    return {"lot": lot, "start": start.isoformat(), "end": end.isoformat(), "available_slots": slots}
+
+
+# ------------------ BOOK ------------------
+@router.post("/")
+def create_reservation(
+    license_plate: str,
+    phone_number: str,
+    vehicle_type: str,
+    start: datetime,
+    end: datetime,
+    lot: str = LOT_CODE,
+    slot_id: int = None
+):
+    start, end = _check_window(start, end)
+    if end - start > timedelta(days=7):
+        raise HTTPException(status_code=400, detail="Bookings are limited to 7 days")
+
+    # Keep part of the lot for walk-ins whatever is booked
+    lot_size = len(RESERVATIONS.lot_slots.get(lot, ()))
+    if RESERVATIONS.peak_booked(lot, start.timestamp(), end.timestamp()) >= lot_size * RESERVATION_MAX_SHARE:
+        raise HTTPException(status_code=409, detail="No slots available for that window")
+
+    # The index proposes slots; the exclusion constraint has the final say
+    candidates = [slot_id] if slot_id else RESERVATIONS.free_slots(lot, start.timestamp(), end.timestamp(), vehicle_type, limit=5)
+    if not candidates:
+        raise HTTPException(status_code=409, detail="No slots available for that window")
+
+    plate, phone = normalize_plate(license_plate), normalize_phone(phone_number)
+    cancel_code, cancel_code_hash = new_cancel_code()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        # Per-plate and per-phone quotas; the locks keep two concurrent requests from both fitting
+        cursor.execute("SELECT pg_advisory_xact_lock(1, hashtext(%s)), pg_advisory_xact_lock(2, hashtext(%s));",
+                       (plate, phone))
+        cursor.execute("""
+            SELECT COUNT(*) FILTER (WHERE license_plate = %s) AS by_plate,
+                   COUNT(*) FILTER (WHERE phone = %s) AS by_phone
+            FROM reservations
+            WHERE (license_plate = %s OR phone = %s) AND upper(during) > now();
+        """, (plate, phone, plate, phone))
+        live = cursor.fetchone()
+        if live["by_plate"] >= RESERVATION_MAX_PER_PLATE or live["by_phone"] >= RESERVATION_MAX_PER_PHONE:
+            conn.rollback()
+            raise HTTPException(status_code=429, detail="Too many active bookings for this vehicle or phone")
+
+        for candidate in candidates:
+            cursor.execute("SAVEPOINT book;")
+            try:
+                cursor.execute("""
+                    INSERT INTO reservations (slot_id, license_plate, phone, vehicle_type, during, cancel_code_hash)
+                    VALUES (%s, %s, %s, %s, tstzrange(%s, %s, '[)'), %s)
+                    RETURNING reservation_id, slot_id, license_plate,
+                              lower(during) AS starts_at, upper(during) AS ends_at;
+                """, (candidate, plate, phone, vehicle_type, start, end, cancel_code_hash))
+            except (psycopg2.errors.ExclusionViolation, psycopg2.errors.ForeignKeyViolation):
+                # Booked meanwhile by another worker (or no such slot); try the next one
+                cursor.execute("ROLLBACK TO SAVEPOINT book;")
+                continue
+            row = cursor.fetchone()
+            conn.commit()
+            RESERVATIONS.add(row)
+            return {
+                "reservation_id": row["reservation_id"],
+                "slot_id": row["slot_id"],
+                "start": row["starts_at"].isoformat(),
+                "end": row["ends_at"].isoformat(),
+                # Shown once; needed to cancel
+                "cancel_code": cancel_code,
+            }
+        conn.rollback()
+        raise HTTPException(status_code=409, detail="No slots available for that window")
+    except HTTPException:
+        raise
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Reservation Error: {e}")
+        raise HTTPException(status_code=500, detail="Error creating reservation")
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+
+# ------------------ CANCEL ------------------
+@router.delete("/{reservation_id}")
+def cancel_reservation(reservation_id: int, code: str = None, api_key: str = Header(None)):
+    """Needs the cancel code returned at booking, or the admin api key."""
+    is_admin = bool(API_KEY) and api_key == API_KEY
+    if not is_admin and not code:
+        raise HTTPException(status_code=401, detail="Cancel code required")
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            DELETE FROM reservations
+            WHERE reservation_id = %s AND (%s OR cancel_code_hash = %s)
+            RETURNING reservation_id;
+        """, (reservation_id, is_admin, hash_cancel_code(code or "")))
+        deleted = cursor.fetchone()
+        if deleted:
+            # Tombstone for the other workers' indexes; old ones are no longer needed
+            cursor.execute("INSERT INTO reservation_cancellations (reservation_id) VALUES (%s) ON CONFLICT DO NOTHING;",
+                           (reservation_id,))
+            cursor.execute("DELETE FROM reservation_cancellations WHERE cancelled_at < now() - interval '1 day';")
+        conn.commit()
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    RESERVATIONS.remove(reservation_id)
+    return {"message": f"Reservation {reservation_id} cancelled"}
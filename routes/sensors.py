@@ -0,0 +1,46 @@
+# routes/sensors.py
+from fastapi import APIRouter, HTTPException, Request, Header
+import os
+from dotenv import load_dotenv
+from sensor_ingest import COALESCER
+
+load_dotenv()
+API_KEY = os.getenv("ADMIN_API_KEY")
+
+router = APIRouter()
+
+
+# ------------------ INGEST SENSOR EVENTS ------------------
+@router.post("/events")
+async def ingest_events(request: Request, api_key: str = Header(None)):
+    """
+    Accepts newline-delimited JSON, one reading per line:
+        {"slot_id": 4, "occupied": true}
+    The body may be a single batch or a long-lived chunked stream. Readings are
+    coalesced in memory and written to the database in bulk every window.
+    """
+    if api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    accepted = rejected = 0
+    tail = b""
+    async for chunk in request.stream():
+        lines = (tail + chunk).split(b"\n")
+        tail = lines.pop()
+        ok, bad = COALESCER.add_lines(lines)
+        accepted += ok
+        rejected += bad
+    if tail:
+        ok, bad = COALESCER.add_lines([tail])
+        accepted += ok
+        rejected += bad
+
+    return {"accepted": accepted, "rejected": rejected}
+
+
+# ------------------ INGESTION STATS ------------------
+@router.get("/stats")
+def ingestion_stats(api_key: str = Header(None)):
+    if api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return COALESCER.stats
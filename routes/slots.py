@@ -2,9 +2,17 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks, Request, Header
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
-from database import get_db_connection
+from database import get_db_connection, release_db_connection, get_read_connection, release_read_connection
 from datetime import datetime, timedelta, timezone
 from notify_whatsapp import send_whatsapp_notification
+from identity import normalize_phone, normalize_plate
+from pricing import compute_amount_due
+from sessions import open_session, close_session, claim_session, record_amount, end_stay
+from exit_tokens import is_legacy_token, verify_token, signing_enabled, make_token, InvalidExitToken, ExpiredExitToken
+from forecast import FORECASTER, FORECAST_TZ, LOT_CODE, ALL_TYPES
+from zoneinfo import ZoneInfo
+from reservations import RESERVATIONS, RESERVATION_HOLD_MINUTES
+from plate_index import ACTIVE_PLATES, AmbiguousPlate, find_active_session
 import os
 import psycopg2.extras
 from dotenv import load_dotenv
@@ -27,7 +35,7 @@ def fetch_as_dict(cursor):
 @router.get("/")
 def get_slots():
     try:
-        conn = get_db_connection()
+        conn = get_read_connection()
         cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         cursor.execute("""
             SELECT s.slot_id, s.is_occupied, s.vehicle_id, 
@@ -39,7 +47,7 @@ def get_slots():
         """)
         slots = cursor.fetchall()
         cursor.close()
-        conn.close()
+        release_read_connection(conn)
         return slots
     except Exception as e:
         print("Error fetching slots:", e)
@@ -47,28 +55,56 @@ def get_slots():
 
 # ------------------ GET VACANT SLOTS ------------------
 @router.get("/vacant")
-def get_vacant_slots():
+def get_vacant_slots(start: datetime = None, end: datetime = None):
+    """
+    Vacant slots that are also free of bookings over [start, end)
+    (default: from now until the walk-in hold window ends).
+    """
+    start = start.replace(tzinfo=ZoneInfo(FORECAST_TZ)) if start and start.tzinfo is None else start
+    end = end.replace(tzinfo=ZoneInfo(FORECAST_TZ)) if end and end.tzinfo is None else end
+    start = start or datetime.now(timezone.utc)
+    end = end or start + timedelta(minutes=RESERVATION_HOLD_MINUTES)
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-        cursor.execute("""
-            SELECT slot_id, slot_name, is_occupied, vehicle_id
-            FROM slots WHERE is_occupied=FALSE ORDER BY slot_id
-        """)
-        data = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        return data
+        conn = get_read_connection()
+        try:
+            cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+            cursor.execute("""
+                SELECT slot_id, slot_code, is_occupied, vehicle_id
+                FROM slots WHERE is_occupied=FALSE ORDER BY slot_id
+            """)
+            data = cursor.fetchall()
+            cursor.close()
+        finally:
+            release_read_connection(conn)
+        return [slot for slot in data if RESERVATIONS.is_free(slot["slot_id"], start.timestamp(), end.timestamp())]
     except Exception as e:
         print("Error fetching vacant slots:", e)
         return []
 
 
+# ------------------ FORECAST OCCUPANCY ------------------
+@router.get("/forecast")
+def get_occupancy_forecast(at: datetime = None, vehicle_type: str = ALL_TYPES, lot: str = LOT_CODE):
+    """
+    Expected occupancy at a given time (ISO 8601, lot-local if no offset is given).
+    Served from the in-memory model; defaults to now.
+    """
+    if at is None:
+        at = datetime.now(timezone.utc)
+    elif at.tzinfo is None:
+        at = at.replace(tzinfo=ZoneInfo(FORECAST_TZ))
+
+    prediction = FORECASTER.predict(at, lot=lot, vehicle_type=vehicle_type)
+    if prediction is None:
+        raise HTTPException(status_code=404, detail="Not enough history to forecast this time yet")
+    return prediction
+
+
 # ------------------ GET FILLED SLOTS ------------------
 @router.get("/filled")
 def get_filled_slots():
     try:
-        conn = get_db_connection()
+        conn = get_read_connection()
         cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         cursor.execute("""
             SELECT slot_id, slot_name, is_occupied, vehicle_id
@@ -76,7 +112,7 @@ def get_filled_slots():
         """)
         data = cursor.fetchall()
         cursor.close()
-        conn.close()
+        release_read_connection(conn)
         return data
     except Exception as e:
         print("Error fetching filled slots:", e)
@@ -98,11 +134,11 @@ def occupy_slot(slot_id: int, vehicle_id: int, background_tasks: BackgroundTasks
         slot = cursor.fetchone()
         if not slot:
             raise HTTPException(status_code=404, detail="Slot not found")
-        if slot[0]:
+        if slot["is_occupied"]:
             raise HTTPException(status_code=400, detail="Slot already occupied")
 
         # Update vehicle and slot
-        entry_time = datetime.now()
+        entry_time = datetime.now(timezone.utc)
         cursor.execute(
             "UPDATE vehicles SET parked_slot=%s, entry_time=%s WHERE vehicle_id=%s",
             (slot_id, entry_time, vehicle_id)
@@ -111,23 +147,24 @@ def occupy_slot(slot_id: int, vehicle_id: int, background_tasks: BackgroundTasks
             "UPDATE slots SET is_occupied=TRUE, vehicle_id=%s WHERE slot_id=%s",
             (vehicle_id, slot_id)
         )
+        session_id = open_session(cursor, vehicle_id, slot_id, entry_time)
 
         cursor.execute("SELECT vehicle_type, phone_number FROM vehicles WHERE vehicle_id=%s", (vehicle_id,))
         vehicle = cursor.fetchone()
         conn.commit()
 
-        # ✅ Send WhatsApp notification (background)
-        if vehicle and vehicle[1]:
-            phone = vehicle[1]
-            if not phone.startswith("+"):
-                phone = "+91" + phone.strip()
+        # ✅ Send WhatsApp notification (background); a signed exit link needs no free_tokens row
+        if vehicle and vehicle["phone_number"]:
+            phone = normalize_phone(vehicle["phone_number"])
+            token = make_token(vehicle_id, slot_id, session_id) if signing_enabled() and session_id else None
 
             background_tasks.add_task(
                 send_whatsapp_notification,
-                to_number=phone,
+                phone_number=phone,
                 slot_id=slot_id,
-                vehicle_type=vehicle[0],
-                vehicle_id=vehicle_id
+                vehicle_type=vehicle["vehicle_type"],
+                vehicle_id=vehicle_id,
+                token_uuid=token,
             )
 
         return {
@@ -145,7 +182,7 @@ def occupy_slot(slot_id: int, vehicle_id: int, background_tasks: BackgroundTasks
         raise HTTPException(status_code=500, detail="Error occupying slot")
     finally:
         cursor.close()
-        conn.close()
+        release_db_connection(conn)
 
 
 # ------------------ FREE SLOT (Admin/API) ------------------
@@ -171,14 +208,13 @@ def free_slot(slot_id: int, api_key: str = Header(None)):
 
         entry_time = vehicle[0]
         exit_time = datetime.now()
-        hours_parked = max((exit_time - entry_time).total_seconds() / 3600, 0.01)
-
-        rates = {"2-wheeler": 30, "4-wheeler": 50, "bicycle": 10}
-        rate = rates.get(vehicle[1], 10)
-        amount_due = round(hours_parked * rate, 2)
+        duration_seconds = (exit_time - entry_time).total_seconds()
+        hours_parked = max(duration_seconds / 3600, 0.01)
+        amount_due = compute_amount_due(vehicle[1], duration_seconds, min_hours=0.01)
 
         cursor.execute("UPDATE slots SET is_occupied=FALSE, vehicle_id=NULL WHERE slot_id=%s", (slot_id,))
         cursor.execute("UPDATE vehicles SET parked_slot=NULL, entry_time=NULL WHERE vehicle_id=%s", (vehicle_id,))
+        close_session(cursor, vehicle_id, exit_time, amount_due)
         conn.commit()
 
         return {
@@ -196,16 +232,97 @@ def free_slot(slot_id: int, api_key: str = Header(None)):
         raise HTTPException(status_code=500, detail="Error freeing slot")
     finally:
         cursor.close()
-        conn.close()
+        release_db_connection(conn)
+
+# ------------------ EXIT BY PLATE (ANPR gates) ------------------
+@router.post("/exit_by_plate/{license_plate}")
+def exit_by_plate(license_plate: str, api_key: str = Header(None)):
+    """
+    Ends the stay of the vehicle a gate camera read. Tolerates O/0 and I/1
+    mix-ups as long as the read matches only one parked vehicle.
+    """
+    if api_key != API_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    conn = get_db_connection()
+    try:
+        with conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                exit_time = datetime.now(timezone.utc)
+                # An exact in-memory hit first. On a miss, or if that session has already
+                # ended, the database decides: exact match, then a unique fuzzy match.
+                active = ACTIVE_PLATES.lookup(license_plate)
+                session = active and claim_session(cursor, active.session_id, exit_time)
+                if not session:
+                    try:
+                        active = find_active_session(cursor, license_plate)
+                    except AmbiguousPlate as e:
+                        raise HTTPException(status_code=409, detail={
+                            "message": "Plate read matches more than one parked vehicle",
+                            "candidates": e.candidates,
+                        })
+                    session = active and claim_session(cursor, active.session_id, exit_time)
+                if not session:
+                    raise HTTPException(status_code=404, detail="No parked vehicle with this plate")
+
+                cursor.execute(
+                    "UPDATE slots SET is_occupied=FALSE, vehicle_id=NULL WHERE slot_id=%s AND vehicle_id=%s;",
+                    (session["slot_id"], session["vehicle_id"])
+                )
+                cursor.execute(
+                    "UPDATE vehicles SET parked_slot=NULL, entry_time=NULL WHERE vehicle_id=%s;",
+                    (session["vehicle_id"],)
+                )
+
+                duration_seconds = (exit_time - session["entry_time"]).total_seconds()
+                amount_due = compute_amount_due(session["vehicle_type"], duration_seconds)
+                record_amount(cursor, session["session_id"], amount_due)
+
+        return {
+            "message": f"Slot {session['slot_id']} is now free",
+            "license_plate": active.license_plate,
+            "exact_match": active.license_plate == normalize_plate(license_plate),
+            "slot_id": session["slot_id"],
+            "entry_time": session["entry_time"].isoformat(),
+            "exit_time": exit_time.isoformat(),
+            "duration": _format_duration(duration_seconds),
+            "amount_due": amount_due
+        }
+    finally:
+        release_db_connection(conn)
 
 import uuid
 from datetime import timedelta
 
 
 # ------------------ FREE SLOT BY USER ------------------
+def _format_duration(duration_seconds):
+    if duration_seconds < 60:
+        return "Less than a minute"
+    if duration_seconds < 3600:
+        minutes = int(duration_seconds // 60)
+        return f"{minutes} minute{'s' if minutes != 1 else ''}"
+    hours = int(duration_seconds // 3600)
+    minutes = int((duration_seconds % 3600) // 60)
+    return f"{hours} hr {minutes} min"
+
+
+def _exit_summary(request, slot_id, vehicle_type, entry_time, exit_time, duration_seconds, amount_due):
+    return templates.TemplateResponse("free_slot.html", {
+        "request": request,
+        "slot_id": slot_id,
+        "vehicle_type": vehicle_type,
+        "entry_time": entry_time.strftime("%Y-%m-%d %H:%M:%S") if entry_time else "N/A",
+        "exit_time": exit_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "duration": _format_duration(duration_seconds),
+        "amount_due": amount_due
+    })
+
+
 @router.get("/free_by_token/{token}", response_class=HTMLResponse)
 def free_by_token_confirm(request: Request, token: str):
-    from datetime import datetime, timezone
+    if not is_legacy_token(token):
+        return _free_by_signed_token(request, token)
 
     conn = get_db_connection()
     try:
@@ -243,46 +360,75 @@ def free_by_token_confirm(request: Request, token: str):
                 vehicle_id = row["vehicle_id"]
                 slot_id = row["slot_id"]
 
-                # Free the slot and mark token as used atomically
-                cursor.execute("UPDATE slots SET is_occupied=FALSE, vehicle_id=NULL WHERE slot_id=%s;", (slot_id,))
-                cursor.execute("UPDATE vehicles SET parked_slot=NULL, entry_time=NULL WHERE vehicle_id=%s;", (vehicle_id,))
+                # Free the slot and mark token as used atomically. Vehicle rows are reused
+                # across visits, so only free the slot if this vehicle is still in it.
+                cursor.execute(
+                    "UPDATE slots SET is_occupied=FALSE, vehicle_id=NULL WHERE slot_id=%s AND vehicle_id=%s RETURNING slot_id;",
+                    (slot_id, vehicle_id)
+                )
+                freed = cursor.fetchone()
                 cursor.execute("UPDATE free_tokens SET used=TRUE WHERE token_uuid=%s;", (token,))
+                if not freed:
+                    # A link from an earlier visit; that stay has already ended
+                    return HTMLResponse("<h3>⚠️ This link has already been used.</h3>", status_code=410)
+                cursor.execute("UPDATE vehicles SET parked_slot=NULL, entry_time=NULL WHERE vehicle_id=%s;", (vehicle_id,))
 
-                # get entry_time safely
-                entry_time = row.get("entry_time")
+                # End the session in this slot only, billed from its entry time
+                exit_time = now
+                session, amount_due = end_stay(cursor, vehicle_id, exit_time, slot_id=slot_id)
+                entry_time = session["entry_time"] if session else row.get("entry_time")
                 if entry_time and entry_time.tzinfo is None:
                     entry_time = entry_time.replace(tzinfo=timezone.utc)
 
-                exit_time = now
-
                 # Compute duration
                 duration_seconds = (exit_time - entry_time).total_seconds() if entry_time else 0
-                if duration_seconds < 60:
-                    duration_str = "Less than a minute"
-                elif duration_seconds < 3600:
-                    minutes = int(duration_seconds // 60)
-                    duration_str = f"{minutes} minute{'s' if minutes != 1 else ''}"
-                else:
-                    hours = int(duration_seconds // 3600)
-                    minutes = int((duration_seconds % 3600) // 60)
-                    duration_str = f"{hours} hr {minutes} min"
-
-                rate_map = {"2-wheeler": 30, "4-wheeler": 50, "bicycle": 10}
-                rate = rate_map.get(row.get("vehicle_type"), 10)
-                billable_hours = max(duration_seconds / 3600, 0.25)
-                amount_due = round(billable_hours * rate, 2)
+                if amount_due is None:
+                    amount_due = compute_amount_due(row.get("vehicle_type"), duration_seconds)
 
                 # TemplateResponse after successful commit
-                return templates.TemplateResponse("free_slot.html", {
-                    "request": request,
-                    "slot_id": slot_id,
-                    "vehicle_type": row.get("vehicle_type"),
-                    "entry_time": entry_time.strftime("%Y-%m-%d %H:%M:%S") if entry_time else "N/A",
-                    "exit_time": exit_time.strftime("%Y-%m-%d %H:%M:%S"),
-                    "duration": duration_str,
-                    "amount_due": amount_due
-                })
+                return _exit_summary(request, slot_id, row.get("vehicle_type"), entry_time, exit_time,
+                                     duration_seconds, amount_due)
     finally:
-        conn.close()
+        release_db_connection(conn)
+
 
+def _free_by_signed_token(request: Request, token: str):
+    """
+    Signed links are checked before touching the database; the session they
+    name can only be closed once, so a second click finds nothing to free.
+    """
+    try:
+        claims = verify_token(token)
+    except ExpiredExitToken:
+        return HTMLResponse("<h3>⏰ Link expired.</h3>", status_code=410)
+    except InvalidExitToken:
+        return HTMLResponse("<h3>❌ Invalid or expired link. Please try registering again.</h3>", status_code=404)
 
+    conn = get_db_connection()
+    try:
+        with conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                exit_time = datetime.now(timezone.utc)
+                session = claim_session(cursor, claims["session_id"], exit_time)
+                if not session or session["vehicle_id"] != claims["vehicle_id"]:
+                    conn.rollback()
+                    return HTMLResponse("<h3>⚠️ This link has already been used.</h3>", status_code=410)
+
+                cursor.execute(
+                    "UPDATE slots SET is_occupied=FALSE, vehicle_id=NULL WHERE slot_id=%s AND vehicle_id=%s;",
+                    (claims["slot_id"], claims["vehicle_id"])
+                )
+                cursor.execute(
+                    "UPDATE vehicles SET parked_slot=NULL, entry_time=NULL WHERE vehicle_id=%s;",
+                    (claims["vehicle_id"],)
+                )
+
+                entry_time = session["entry_time"]
+                duration_seconds = (exit_time - entry_time).total_seconds()
+                amount_due = compute_amount_due(session["vehicle_type"], duration_seconds)
+                record_amount(cursor, session["session_id"], amount_due)
+
+                return _exit_summary(request, claims["slot_id"], session["vehicle_type"], entry_time, exit_time,
+                                     duration_seconds, amount_due)
+    finally:
+        release_db_connection(conn)
@@ -1,8 +1,11 @@
 from fastapi import APIRouter, Header, HTTPException, BackgroundTasks
-from database import get_db_connection
+from database import get_db_connection, release_db_connection
 import os
 from dotenv import load_dotenv
 from notify_whatsapp import send_whatsapp_notification
+from identity import resolve_vehicle, remember_identity
+from sessions import end_stay
+from datetime import datetime, timezone
 
 load_dotenv()
 API_KEY = os.getenv("ADMIN_API_KEY")
@@ -24,18 +27,17 @@ def add_vehicle(
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    # Insert vehicle
-    cursor.execute(
-        """
-        INSERT INTO vehicles (license_plate, user_id, vehicle_type, phone_number)
-        VALUES (%s, %s, %s, %s) RETURNING vehicle_id
-        """,
-        (license_plate, user_id, vehicle_type, phone_number)
-    )
-    vehicle_row = cursor.fetchone()
-    vehicle_id = vehicle_row[0] if vehicle_row else None
-
-    conn.commit()
+    try:
+        # Insert vehicle (or refresh the existing one with the same plate)
+        vehicle_id = resolve_vehicle(cursor, license_plate, user_id, vehicle_type, phone_number)
+        if vehicle_id is None:
+            conn.rollback()
+            raise HTTPException(status_code=409, detail="Vehicle is currently parked")
+        conn.commit()
+    finally:
+        cursor.close()
+        release_db_connection(conn)
+    remember_identity(license_plate=license_plate, vehicle_id=vehicle_id)
 
     # ---------------- WhatsApp Notification ----------------
     if vehicle_id and phone_number:
@@ -47,8 +49,6 @@ def add_vehicle(
             vehicle_id=vehicle_id
         )
 
-    cursor.close()
-    conn.close()
     return {"message": f"Vehicle {license_plate} registered", "vehicle_id": vehicle_id}
 
 
@@ -59,21 +59,26 @@ def remove_vehicle(vehicle_id: int, background_tasks: BackgroundTasks, api_key:
 
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT parked_slot FROM vehicles WHERE vehicle_id=%s", (vehicle_id,))
-    vehicle = cursor.fetchone()
-    if not vehicle:
-        cursor.close()
-        conn.close()
-        raise HTTPException(status_code=404, detail="Vehicle not found")
+    try:
+        cursor.execute("SELECT parked_slot FROM vehicles WHERE vehicle_id=%s", (vehicle_id,))
+        vehicle = cursor.fetchone()
+        if not vehicle:
+            raise HTTPException(status_code=404, detail="Vehicle not found")
 
-    if vehicle["parked_slot"]:
-        cursor.execute(
-            "UPDATE slots SET is_occupied=FALSE, vehicle_id=NULL WHERE slot_id=%s",
-            (vehicle["parked_slot"],)
-        )
+        if vehicle["parked_slot"]:
+            cursor.execute(
+                "UPDATE slots SET is_occupied=FALSE, vehicle_id=NULL WHERE slot_id=%s AND vehicle_id=%s",
+                (vehicle["parked_slot"], vehicle_id)
+            )
 
-    cursor.execute("DELETE FROM vehicles WHERE vehicle_id=%s", (vehicle_id,))
-    conn.commit()
-    cursor.close()
-    conn.close()
+        # End the stay first; the session keeps its plate after the vehicle row is gone
+        end_stay(cursor, vehicle_id, datetime.now(timezone.utc))
+        cursor.execute("DELETE FROM vehicles WHERE vehicle_id=%s", (vehicle_id,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        release_db_connection(conn)
     return {"message": f"Vehicle {vehicle_id} removed"}
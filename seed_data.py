@@ -12,12 +12,13 @@ def seed_database():
 
     # 1️⃣ Create 10 slots if they don’t exist
     print("🅿️  Creating slots...")
-    for i in range(1, 11):
-        cursor.execute("""
-            INSERT INTO slots (slot_id, is_occupied, vehicle_id)
-            VALUES (%s, FALSE, NULL)
-            ON CONFLICT (slot_id) DO NOTHING;
-        """, (i,))
+    cursor.execute("""
+        INSERT INTO slots (slot_id, is_occupied, vehicle_id)
+        SELECT i, FALSE, NULL FROM generate_series(1, 10) AS i
+        ON CONFLICT (slot_id) DO NOTHING;
+    """)
+    # Explicit ids bypass the sequence; move it past them so later inserts don't collide
+    cursor.execute("SELECT setval(pg_get_serial_sequence('slots', 'slot_id'), (SELECT MAX(slot_id) FROM slots));")
 
     conn.commit()
     cursor.close()
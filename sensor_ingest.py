@@ -0,0 +1,202 @@
+import io
+import json
+import os
+import socket
+import threading
+import time
+
+from database import get_db_connection, release_db_connection
+
+# Updates are coalesced per slot and written once per window
+SENSOR_WINDOW_SECONDS = float(os.getenv("SENSOR_WINDOW_SECONDS", "0.5"))
+# A reading must hold this long before it is applied (ignores flapping sensors)
+SENSOR_DEBOUNCE_SECONDS = float(os.getenv("SENSOR_DEBOUNCE_SECONDS", "2"))
+# Local UDP listener, off unless a port is given
+SENSOR_UDP_HOST = os.getenv("SENSOR_UDP_HOST", "127.0.0.1")
+SENSOR_UDP_PORT = os.getenv("SENSOR_UDP_PORT")
+
+
+class SensorCoalescer:
+    """
+    Keeps the latest reading per slot. A reading only becomes an update once
+    it has been stable for the debounce period, so thousands of events per slot
+    collapse into one row per window. Readings that match the table already are
+    dropped by the UPDATE itself, since registration and exits write it too.
+    """
+
+    def __init__(self, debounce=SENSOR_DEBOUNCE_SECONDS):
+        self.debounce = debounce
+        self._pending = {}  # slot_id -> (is_occupied, first seen at)
+        self._lock = threading.Lock()
+        self.stats = {"events": 0, "rejected": 0, "flushes": 0, "rows_staged": 0, "slots_changed": 0}
+
+    def add_lines(self, lines, now=None):
+        """
+        Parses NDJSON lines like {"slot_id": 4, "occupied": true}.
+        Returns (accepted, rejected).
+        """
+        readings = []
+        rejected = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+                readings.append((int(event["slot_id"]), _parse_occupied(event["occupied"])))
+            except (ValueError, KeyError, TypeError):
+                rejected += 1
+
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            pending = self._pending
+            for slot_id, occupied in readings:
+                current = pending.get(slot_id)
+                if current is None or current[0] != occupied:
+                    pending[slot_id] = (occupied, now)
+            self.stats["events"] += len(readings)
+            self.stats["rejected"] += rejected
+        return len(readings), rejected
+
+    def drain(self, now=None):
+        """Takes the readings that have settled and still need writing."""
+        now = time.monotonic() if now is None else now
+        ready = []
+        with self._lock:
+            for slot_id, (occupied, since) in list(self._pending.items()):
+                if now - since < self.debounce:
+                    continue
+                del self._pending[slot_id]
+                ready.append((slot_id, occupied))
+        return ready
+
+    def requeue(self, updates):
+        """Puts updates back after a failed write so the next flush retries them."""
+        with self._lock:
+            for slot_id, occupied in updates:
+                self._pending.setdefault(slot_id, (occupied, 0.0))
+
+
+def _parse_occupied(value):
+    """JSON true/false or 0/1 only; bool("false") would read as occupied."""
+    if isinstance(value, bool):
+        return value
+    if type(value) is int and value in (0, 1):
+        return bool(value)
+    raise ValueError(f"occupied must be true/false or 0/1, got {value!r}")
+
+
+COALESCER = SensorCoalescer()
+
+
+# ------------------ Bulk write ------------------
+def apply_updates(updates):
+    """
+    COPYs the settled readings into a per-connection staging table and merges
+    them into slots with one UPDATE. Returns the number of slots that changed.
+
+    A "free" reading never frees a slot a registered vehicle is parked in:
+    that stay has an open session and is ended (and billed) by an exit path.
+    """
+    if not updates:
+        return 0
+
+    buf = io.StringIO("".join(f"{slot_id}\t{'t' if occupied else 'f'}\n" for slot_id, occupied in updates))
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS sensor_staging (
+                    slot_id INTEGER,
+                    is_occupied BOOLEAN
+                ) ON COMMIT DELETE ROWS;
+            """)
+            cursor.copy_expert("COPY sensor_staging (slot_id, is_occupied) FROM STDIN", buf)
+            cursor.execute("""
+                UPDATE slots s
+                SET is_occupied = st.is_occupied
+                FROM sensor_staging st
+                WHERE s.slot_id = st.slot_id
+                  AND s.is_occupied IS DISTINCT FROM st.is_occupied
+                  AND (st.is_occupied OR s.vehicle_id IS NULL);
+            """)
+            changed = cursor.rowcount
+        conn.commit()
+        return changed
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_db_connection(conn)
+
+
+def flush(coalescer=COALESCER):
+    updates = coalescer.drain()
+    if not updates:
+        return 0
+    try:
+        changed = apply_updates(updates)
+    except Exception as e:
+        print(f"❌ Sensor flush failed, will retry: {e}")
+        coalescer.requeue(updates)
+        return 0
+    coalescer.stats["flushes"] += 1
+    coalescer.stats["rows_staged"] += len(updates)
+    coalescer.stats["slots_changed"] += changed
+    return changed
+
+
+# ------------------ Background workers ------------------
+_stop = threading.Event()
+_threads = []
+
+
+def _flush_loop():
+    while not _stop.wait(SENSOR_WINDOW_SECONDS):
+        flush()
+    flush()
+
+
+def _udp_loop(sock):
+    while not _stop.is_set():
+        try:
+            data, _ = sock.recvfrom(65535)
+        except socket.timeout:
+            continue
+        except OSError:
+            break
+        COALESCER.add_lines(data.split(b"\n"))
+    sock.close()
+
+
+def start():
+    """Starts the flusher thread and, if SENSOR_UDP_PORT is set, the UDP listener."""
+    if _threads:
+        return
+    _stop.clear()
+    _threads.append(threading.Thread(target=_flush_loop, name="sensor-flush", daemon=True))
+
+    if SENSOR_UDP_PORT:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        # Every uvicorn worker binds the port; the kernel keeps each sender on one of them
+        if hasattr(socket, "SO_REUSEPORT"):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        try:
+            sock.bind((SENSOR_UDP_HOST, int(SENSOR_UDP_PORT)))
+        except OSError as e:
+            sock.close()
+            print(f"⚠️ UDP sensor port {SENSOR_UDP_PORT} not bound here ({e}); another worker is listening on it")
+        else:
+            sock.settimeout(0.5)
+            _threads.append(threading.Thread(target=_udp_loop, args=(sock,), name="sensor-udp", daemon=True))
+            print(f"📡 Listening for sensor events on udp://{SENSOR_UDP_HOST}:{SENSOR_UDP_PORT}")
+
+    for thread in _threads:
+        thread.start()
+
+
+def stop():
+    _stop.set()
+    for thread in _threads:
+        thread.join(timeout=5)
+    _threads.clear()
@@ -0,0 +1,88 @@
+# 🅿️ Parking sessions: one row per stay, opened at entry and closed at exit.
+# vehicles only holds the current stay; this is the history finance exports from.
+from plate_index import ACTIVE_PLATES, ActiveSession
+from pricing import compute_amount_due
+
+
+def open_session(cursor, vehicle_id: int, slot_id: int, entry_time):
+    """Starts a stay for the vehicle, copying its plate and type as they are now."""
+    # A plate has one open session at most. One left open by a path that never
+    # closed it (e.g. a sensor freeing the slot) is ended here, unbilled.
+    cursor.execute("""
+        UPDATE parking_sessions SET exit_time = %s
+        WHERE exit_time IS NULL
+          AND license_plate = (SELECT license_plate FROM vehicles WHERE vehicle_id = %s)
+        RETURNING session_id;
+    """, (entry_time, vehicle_id))
+    for stale in cursor.fetchall():
+        ACTIVE_PLATES.discard(stale["session_id"] if isinstance(stale, dict) else stale[0])
+
+    cursor.execute("""
+        INSERT INTO parking_sessions (vehicle_id, slot_id, license_plate, vehicle_type, entry_time)
+        SELECT vehicle_id, %s, license_plate, vehicle_type, %s
+        FROM vehicles WHERE vehicle_id = %s
+        RETURNING session_id, license_plate;
+    """, (slot_id, entry_time, vehicle_id))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    session_id, plate = (row["session_id"], row["license_plate"]) if isinstance(row, dict) else row
+    ACTIVE_PLATES.add(ActiveSession(session_id, vehicle_id, slot_id, plate))
+    return session_id
+
+
+def close_session(cursor, vehicle_id: int, exit_time, amount_due):
+    """Ends the vehicle's open stay, if any, and records what was charged."""
+    cursor.execute("""
+        UPDATE parking_sessions
+        SET exit_time = %s, amount_due = %s
+        WHERE vehicle_id = %s AND exit_time IS NULL
+        RETURNING session_id;
+    """, (exit_time, amount_due, vehicle_id))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    session_id = row["session_id"] if isinstance(row, dict) else row[0]
+    ACTIVE_PLATES.discard(session_id)
+    return session_id
+
+
+def claim_session(cursor, session_id: int, exit_time):
+    """
+    Ends an open session by id and returns it. Returns None if it has already
+    ended, which is what makes signed exit links single use.
+    """
+    cursor.execute("""
+        UPDATE parking_sessions
+        SET exit_time = %s
+        WHERE session_id = %s AND exit_time IS NULL
+        RETURNING session_id, vehicle_id, slot_id, vehicle_type, entry_time;
+    """, (exit_time, session_id))
+    row = cursor.fetchone()
+    ACTIVE_PLATES.discard(session_id)
+    return row
+
+
+def record_amount(cursor, session_id: int, amount_due):
+    cursor.execute("UPDATE parking_sessions SET amount_due = %s WHERE session_id = %s;", (amount_due, session_id))
+
+
+def end_stay(cursor, vehicle_id: int, exit_time, slot_id: int = None):
+    """
+    Closes the vehicle's open session, if any (only one in slot_id, when
+    given), billed at the tariff from the session's own entry time. For exit
+    paths that don't price the stay themselves. Returns (session, amount_due),
+    or (None, None).
+    """
+    cursor.execute("""
+        SELECT session_id FROM parking_sessions
+        WHERE vehicle_id = %s AND exit_time IS NULL
+          AND (%s::int IS NULL OR slot_id = %s);
+    """, (vehicle_id, slot_id, slot_id))
+    row = cursor.fetchone()
+    session = row and claim_session(cursor, row["session_id"], exit_time)
+    if not session:
+        return None, None
+    amount_due = compute_amount_due(session["vehicle_type"], (exit_time - session["entry_time"]).total_seconds())
+    record_amount(cursor, session["session_id"], amount_due)
+    return session, amount_due
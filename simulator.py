@@ -0,0 +1,269 @@
+"""
+Discrete-event simulator for the parking lot (the "twin" part of the digital twin).
+
+Runs a stream of arrivals and departures through the allocation rule /register
+uses (reservations.choose_slot: a booked vehicle gets its slot, walk-ins get
+the lowest vacant slot not booked within the hold window, turned away when
+full) and the tariff in pricing.py, as fast as the CPU allows. Demand can be
+synthetic or replayed from a CSV of past visits; a share of it can be booked
+in advance.
+
+    python simulator.py --slots 5000 --days 30
+    python simulator.py --slots 200 --history visits.csv --rates 4-wheeler=60
+    python simulator.py --slots 500 --days 7 --booked-share 0.2
+"""
+import argparse
+import csv
+import heapq
+import time
+from datetime import datetime
+
+import numpy as np
+
+from pricing import RATE_MAP, DEFAULT_RATE, MIN_BILLABLE_HOURS
+from reservations import ReservationIndex, choose_slot, RESERVATION_HOLD_MINUTES
+
+VEHICLE_TYPES = ("2-wheeler", "4-wheeler", "bicycle")
+DAY = 86400
+SIM_LOT = "sim"
+
+# Relative arrival intensity per hour of day (morning and evening peaks)
+DEFAULT_HOURLY_PROFILE = np.array([
+    0.1, 0.05, 0.05, 0.05, 0.1, 0.2, 0.5, 0.9, 1.0, 0.9, 0.7, 0.6,
+    0.6, 0.6, 0.6, 0.6, 0.7, 0.9, 1.0, 0.9, 0.7, 0.5, 0.3, 0.2,
+])
+
+
+# ------------------ Demand ------------------
+def synthetic_demand(days, peak_arrivals_per_hour, mix=(0.5, 0.45, 0.05),
+                     mean_stay_hours=(1.5, 3.0, 2.0), hourly_profile=DEFAULT_HOURLY_PROFILE, seed=None):
+    """
+    Non-homogeneous Poisson arrivals (generated at peak rate, then thinned by the
+    hourly profile) with log-normal stays. Returns (arrivals_s, stays_s, type_idx).
+    """
+    rng = np.random.default_rng(seed)
+    horizon = days * DAY
+    profile = np.asarray(hourly_profile, dtype=float)
+    profile = profile / profile.max()
+
+    expected = int(peak_arrivals_per_hour * horizon / 3600)
+    gaps = rng.exponential(3600 / peak_arrivals_per_hour, size=int(expected * 1.1) + 100)
+    arrivals = np.cumsum(gaps)
+    arrivals = arrivals[arrivals < horizon]
+    keep = rng.random(arrivals.size) < profile[((arrivals % DAY) // 3600).astype(int)]
+    arrivals = arrivals[keep]
+
+    types = rng.choice(len(VEHICLE_TYPES), size=arrivals.size, p=np.asarray(mix) / np.sum(mix))
+
+    # Log-normal with the requested mean per vehicle type
+    sigma = 0.8
+    mu = np.log(np.asarray(mean_stay_hours, dtype=float) * 3600) - sigma ** 2 / 2
+    stays = rng.lognormal(mu[types], sigma)
+
+    return arrivals, stays, types
+
+
+def load_history(path):
+    """
+    Replays past visits from a CSV with entry_time, exit_time (ISO 8601) and
+    vehicle_type columns. Times are shifted so the first entry is t=0.
+    """
+    entries, exits, types = [], [], []
+    type_index = {t: i for i, t in enumerate(VEHICLE_TYPES)}
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            if not row.get("entry_time") or not row.get("exit_time"):
+                continue
+            entries.append(datetime.fromisoformat(row["entry_time"]).timestamp())
+            exits.append(datetime.fromisoformat(row["exit_time"]).timestamp())
+            types.append(type_index.get(row.get("vehicle_type"), 0))
+
+    entries = np.asarray(entries, dtype=float)
+    if entries.size == 0:
+        raise ValueError(f"No usable visits in {path}")
+    stays = np.maximum(np.asarray(exits, dtype=float) - entries, 0)
+    return entries - entries.min(), stays, np.asarray(types, dtype=np.int64)
+
+
+# ------------------ Engine ------------------
+def book_in_advance(index, arrivals, departures, booked):
+    """
+    Books the `booked` visits into the index the way POST /reservations/ does
+    (lowest slot free for the whole stay). Returns the plate of each visit:
+    "R<i>" if its booking succeeded, None for walk-ins. `arrivals` must be
+    sorted: each slot's latest booking then also ends last, so a slot is free
+    for the next booking once that one has ended, and the lowest such slot
+    comes off a heap instead of a scan of the lot per booking.
+    """
+    plates = [None] * arrivals.size
+    free = sorted(slot for slot, _ in index.lot_slots.get(SIM_LOT, ()))
+    booked_until = []  # (end, slot)
+    heappush, heappop = heapq.heappush, heapq.heappop
+    for i in np.flatnonzero(booked).tolist():
+        start, end = arrivals[i], departures[i]
+        while booked_until and booked_until[0][0] <= start:
+            heappush(free, heappop(booked_until)[1])
+        if free:
+            slot = heappop(free)
+            plates[i] = f"R{i}"
+            index.add_interval(i + 1, slot, plates[i], start, end)
+            heappush(booked_until, (end, slot))
+    return plates
+
+
+def simulate(arrivals, stays, types, n_slots, rates=None, sample_every=900, booked=None):
+    """
+    Plays the events through the lot. Only admission is sequential (it depends
+    on who is still parked); demand generation, billing and the occupancy curve
+    are computed on whole arrays. `booked` marks visits reserved in advance.
+    """
+    rates = {**RATE_MAP, **(rates or {})}
+    order = np.argsort(arrivals, kind="stable")
+    arrivals, stays, types = arrivals[order], stays[order], types[order]
+    departures = arrivals + stays
+
+    index = ReservationIndex()
+    index.set_slots([{"slot_id": slot, "lot_code": SIM_LOT, "slot_type": None} for slot in range(n_slots)])
+    plates = (book_in_advance(index, arrivals, departures, np.asarray(booked)[order])
+              if booked is not None else [None] * arrivals.size)
+
+    # 1️⃣ Allocation — reservations.choose_slot, the rule register_vehicle uses.
+    # A slot is held from when its next booking starts within the hold window
+    # until that booking ends; `free` only offers vacant slots that are not
+    # held, so choose_slot takes the first one it is given.
+    hold = RESERVATION_HOLD_MINUTES * 60
+    slot_of = np.full(arrivals.size, -1, dtype=np.int64)
+    free = list(range(n_slots))  # vacant, unheld slots; a sorted list is already a valid heap
+    vacant = set(free)           # the heap may hold stale entries, these are the truth
+    holds = [0] * n_slots        # bookings holding each slot
+    upcoming = sorted((start, slot, end) for slot, start, end, _ in index.by_id.values())
+    next_booking = 0
+    holding = []  # (end, slot)
+    busy = []     # (departure_time, slot)
+    heappush, heappop = heapq.heappush, heapq.heappop
+    skipped = []
+
+    def vacant_slots():
+        while free:
+            slot = heappop(free)
+            if slot in vacant and not holds[slot]:
+                skipped.append(slot)
+                yield slot
+
+    for i, (t, leave) in enumerate(zip(arrivals.tolist(), departures.tolist())):
+        while busy and busy[0][0] <= t:
+            slot = heappop(busy)[1]
+            vacant.add(slot)
+            if not holds[slot]:
+                heappush(free, slot)
+        # Same bounds as SlotIntervals.overlaps(t, t + hold)
+        hold_until = t + hold
+        while next_booking < len(upcoming) and upcoming[next_booking][0] < hold_until:
+            _, slot, end = upcoming[next_booking]
+            next_booking += 1
+            holds[slot] += 1
+            heappush(holding, (end, slot))
+        while holding and holding[0][0] <= t:
+            slot = heappop(holding)[1]
+            holds[slot] -= 1
+            if not holds[slot] and slot in vacant:
+                heappush(free, slot)
+
+        slot = choose_slot(index, plates[i], t, vacant_slots(), vacant.__contains__)
+        for other in skipped:
+            if other != slot:
+                heappush(free, other)
+        skipped.clear()
+        if slot is not None:
+            vacant.discard(slot)
+            slot_of[i] = slot
+            heappush(busy, (leave, slot))
+
+    admitted = slot_of >= 0
+
+    # 2️⃣ Billing — same formula as pricing.compute_amount_due, vectorized
+    rate_per_type = np.array([rates.get(t, DEFAULT_RATE) for t in VEHICLE_TYPES], dtype=float)
+    billable_hours = np.maximum(stays[admitted] / 3600, MIN_BILLABLE_HOURS)
+    amounts = np.round(billable_hours * rate_per_type[types[admitted]], 2)
+
+    # 3️⃣ Occupancy curve — arrivals so far minus departures so far
+    horizon = departures.max() if departures.size else 0
+    grid = np.arange(0, horizon + sample_every, sample_every)
+    occupancy = (np.searchsorted(arrivals[admitted], grid, side="right")
+                 - np.searchsorted(np.sort(departures[admitted]), grid, side="right"))
+
+    # 4️⃣ Per-type rejection rates and daily revenue (booked at exit)
+    rejection = {}
+    for idx, name in enumerate(VEHICLE_TYPES):
+        mask = types == idx
+        if mask.any():
+            rejection[name] = float(1 - admitted[mask].mean())
+    exit_day = (departures[admitted] // DAY).astype(np.int64)
+    daily_revenue = np.bincount(exit_day, weights=amounts) if amounts.size else np.zeros(0)
+
+    return {
+        "arrivals": int(arrivals.size),
+        "admitted": int(admitted.sum()),
+        "booked": sum(plate is not None for plate in plates),
+        "rejection_rate": float(1 - admitted.mean()) if arrivals.size else 0.0,
+        "rejection_by_type": rejection,
+        "revenue": float(amounts.sum()),
+        "daily_revenue": daily_revenue,
+        "occupancy_times": grid,
+        "occupancy": occupancy,
+        "peak_occupancy": int(occupancy.max()) if occupancy.size else 0,
+        "slot_utilisation": np.bincount(slot_of[admitted], weights=stays[admitted], minlength=n_slots) / max(horizon, 1),
+    }
+
+
+def write_occupancy_csv(result, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["hours_since_start", "occupied"])
+        for t, occ in zip((result["occupancy_times"] / 3600).tolist(), result["occupancy"].tolist()):
+            writer.writerow([round(t, 2), occ])
+
+
+def _parse_rates(text):
+    rates = {}
+    for part in filter(None, (text or "").split(",")):
+        name, value = part.split("=")
+        rates[name.strip()] = float(value)
+    return rates
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate a day (or month) at the lot.")
+    parser.add_argument("--slots", type=int, default=10)
+    parser.add_argument("--days", type=float, default=1)
+    parser.add_argument("--peak-rate", type=float, default=None,
+                        help="arrivals per hour at peak (default: 1.2 × slots / mean stay)")
+    parser.add_argument("--history", help="CSV of past visits to replay instead of synthetic demand")
+    parser.add_argument("--rates", help="tariff overrides, e.g. 4-wheeler=60,2-wheeler=35")
+    parser.add_argument("--booked-share", type=float, default=0.0,
+                        help="fraction of visits reserved in advance (default 0)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--out", help="write the occupancy curve to this CSV")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.history:
+        arrivals, stays, types = load_history(args.history)
+    else:
+        peak_rate = args.peak_rate or 1.2 * args.slots / 2.2
+        arrivals, stays, types = synthetic_demand(args.days, peak_rate, seed=args.seed)
+
+    booked = np.random.default_rng(args.seed).random(arrivals.size) < args.booked_share if args.booked_share else None
+    result = simulate(arrivals, stays, types, args.slots, rates=_parse_rates(args.rates), booked=booked)
+    elapsed = time.perf_counter() - started
+
+    print(f"🅿️  {args.slots} slots, {result['arrivals']} arrivals simulated in {elapsed:.2f}s")
+    print(f"✅ Admitted: {result['admitted']} ({result['booked']} booked)  ❌ Rejected: {result['rejection_rate']:.1%}")
+    for name, rate in result["rejection_by_type"].items():
+        print(f"   {name}: {rate:.1%} rejected")
+    print(f"📈 Peak occupancy: {result['peak_occupancy']}")
+    print(f"💰 Revenue: ₹{result['revenue']:,.2f}")
+
+    if args.out:
+        write_occupancy_csv(result, args.out)
+        print(f"📝 Occupancy curve written to {args.out}")
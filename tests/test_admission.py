@@ -0,0 +1,161 @@
+import asyncio
+
+import pytest
+
+import admission
+from admission import AdmissionControl, TokenBuckets, _client_ip
+
+
+def test_burst_then_wait():
+    buckets = TokenBuckets(rate=2, burst=3)
+    assert [buckets.take("ip", 0.0) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take("ip", 0.0) == 0.5  # one token at 2/s
+
+
+def test_refill_is_capped_at_burst():
+    buckets = TokenBuckets(rate=1, burst=2)
+    buckets.take("ip", 0.0)
+    buckets.take("ip", 0.0)
+    assert buckets.take("ip", 100.0) == 0       # refilled, but only to 2
+    assert buckets.take("ip", 100.0) == 0
+    assert buckets.take("ip", 100.0) > 0
+
+
+def test_partial_refill():
+    buckets = TokenBuckets(rate=1, burst=1)
+    assert buckets.take("ip", 0.0) == 0
+    assert buckets.take("ip", 0.5) == 0.5
+    assert buckets.take("ip", 1.0) == 0         # the denied take cost nothing
+
+
+def test_keys_are_independent():
+    buckets = TokenBuckets(rate=1, burst=1)
+    assert buckets.take("a", 0.0) == 0
+    assert buckets.take("b", 0.0) == 0
+    assert buckets.take("a", 0.0) > 0
+
+
+def test_least_recently_used_key_is_dropped():
+    buckets = TokenBuckets(rate=1, burst=1, max_keys=2)
+    buckets.take("a", 0.0)
+    buckets.take("b", 0.0)
+    buckets.take("c", 0.0)
+    assert buckets.take("a", 0.0) == 0          # forgotten, so full again
+    assert buckets.take("c", 0.0) > 0
+
+
+def test_client_ip_ignores_forwarded_for_by_default(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_TRUST_FORWARDED", False)
+    scope = {"client": ("10.0.0.5", 5000)}
+    assert _client_ip(scope, {b"x-forwarded-for": b"1.2.3.4"}) == "10.0.0.5"
+
+
+def test_client_ip_takes_proxy_appended_hop(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_TRUST_FORWARDED", True)
+    scope = {"client": ("10.0.0.5", 5000)}
+    # The client sent "1.2.3.4"; the proxy appended the address it saw
+    assert _client_ip(scope, {b"x-forwarded-for": b"1.2.3.4, 203.0.113.9"}) == "203.0.113.9"
+    assert _client_ip({"client": None}, {}) == "unknown"
+
+
+# ------------------ Middleware ------------------
+class HeldApp:
+    """Downstream app whose requests stay in flight until release() is called."""
+
+    def __init__(self):
+        self.release_event = asyncio.Event()
+
+    def release(self):
+        self.release_event.set()
+
+    async def __call__(self, scope, receive, send):
+        await self.release_event.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+def _scope(path, api_key=None, client="10.0.0.5"):
+    headers = [(b"api-key", api_key.encode())] if api_key else []
+    return {"type": "http", "path": path, "headers": headers, "client": (client, 5000)}
+
+
+async def _call(control, scope):
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    await control(scope, None, send)
+    start = messages[0]
+    return start["status"], dict(start["headers"])
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(admission, "API_KEY", "secret")
+    monkeypatch.setattr(admission, "ADMISSION_MAX_INFLIGHT", 4)
+    monkeypatch.setattr(admission, "ADMISSION_PRIORITY_RESERVE", 2)
+    monkeypatch.setattr(admission, "ADMISSION_PUBLIC_CONCURRENCY", 10)
+
+
+def test_sheds_normal_traffic_but_keeps_the_priority_lane(limits):
+    async def scenario():
+        app = HeldApp()
+        control = AdmissionControl(app)
+        held = [asyncio.create_task(_call(control, _scope("/slots/"))) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert control.inflight == 2
+
+        status, headers = await _call(control, _scope("/slots/"))
+        assert status == 503 and headers[b"retry-after"] == b"1"
+
+        held.append(asyncio.create_task(_call(control, _scope("/slots/", api_key="secret"))))
+        await asyncio.sleep(0)
+        assert control.inflight == 3
+
+        app.release()
+        assert [status for status, _ in await asyncio.gather(*held)] == [200, 200, 200]
+        assert control.inflight == 0
+        return control.counters
+
+    counters = asyncio.run(scenario())
+    assert counters["shed_saturated"] == 1
+    assert counters["admitted_priority"] == 1 and counters["admitted_normal"] == 2
+
+
+def test_rate_limits_public_links_per_client(limits, monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_CLIENT_BURST", 2)
+    monkeypatch.setattr(admission, "ADMISSION_CLIENT_RATE", 0.5)
+
+    async def scenario():
+        app = HeldApp()
+        app.release()
+        control = AdmissionControl(app)
+        statuses = [await _call(control, _scope("/register")) for _ in range(3)]
+        other_client = await _call(control, _scope("/register", client="10.0.0.6"))
+        admin = await _call(control, _scope("/register", api_key="secret"))
+        return statuses, other_client, admin
+
+    statuses, other_client, admin = asyncio.run(scenario())
+    assert [status for status, _ in statuses] == [200, 200, 429]
+    assert statuses[2][1][b"retry-after"] == b"2"   # one token at 0.5/s
+    assert other_client[0] == 200
+    assert admin[0] == 200                          # the priority lane is not rate limited
+
+
+def test_streams_have_their_own_cap(limits, monkeypatch):
+    monkeypatch.setattr(admission, "STREAM_ROUTES", {"/admin/export/": 1})
+
+    async def scenario():
+        app = HeldApp()
+        control = AdmissionControl(app)
+        first = asyncio.create_task(_call(control, _scope("/admin/export/sessions", api_key="secret")))
+        await asyncio.sleep(0)
+        second = await _call(control, _scope("/admin/export/sessions", api_key="secret"))
+        app.release()
+        return (await first)[0], second, control.inflight
+
+    first, second, inflight = asyncio.run(scenario())
+    assert first == 200
+    assert second[0] == 503 and second[1][b"retry-after"] == b"5"
+    assert inflight == 0
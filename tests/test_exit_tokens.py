@@ -0,0 +1,73 @@
+import base64
+import uuid
+
+import pytest
+
+import exit_tokens
+from exit_tokens import ExpiredExitToken, InvalidExitToken, is_legacy_token, make_token, verify_token
+
+
+@pytest.fixture(autouse=True)
+def secret(monkeypatch):
+    monkeypatch.setattr(exit_tokens, "EXIT_TOKEN_SECRET", "test-secret")
+
+
+def _flip_byte(token, index):
+    raw = bytearray(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    raw[index] ^= 0x01
+    return base64.urlsafe_b64encode(bytes(raw)).decode().rstrip("=")
+
+
+def test_round_trip():
+    claims = verify_token(make_token(7, 3, 12345))
+    assert (claims["vehicle_id"], claims["slot_id"], claims["session_id"]) == (7, 3, 12345)
+
+
+def test_expired():
+    with pytest.raises(ExpiredExitToken):
+        verify_token(make_token(7, 3, 1, ttl_seconds=-1))
+
+
+def test_tampered_payload_is_rejected():
+    with pytest.raises(InvalidExitToken):
+        verify_token(_flip_byte(make_token(7, 3, 1), 2))
+
+
+def test_tampered_signature_is_rejected():
+    with pytest.raises(InvalidExitToken):
+        verify_token(_flip_byte(make_token(7, 3, 1), -1))
+
+
+def test_other_secret_is_rejected(monkeypatch):
+    token = make_token(7, 3, 1)
+    monkeypatch.setattr(exit_tokens, "EXIT_TOKEN_SECRET", "another-secret")
+    with pytest.raises(InvalidExitToken):
+        verify_token(token)
+
+
+@pytest.mark.parametrize("token", ["", "abc", "!!!!", "A" * 200])
+def test_malformed(token):
+    with pytest.raises(InvalidExitToken):
+        verify_token(token)
+
+
+def test_truncated():
+    with pytest.raises(InvalidExitToken):
+        verify_token(make_token(7, 3, 1)[:-4])
+
+
+def test_no_secret(monkeypatch):
+    token = make_token(7, 3, 1)
+    monkeypatch.setattr(exit_tokens, "EXIT_TOKEN_SECRET", None)
+    with pytest.raises(InvalidExitToken):
+        verify_token(token)
+
+
+def test_expired_is_an_invalid_token():
+    # Callers that only catch InvalidExitToken still turn expired links away
+    assert issubclass(ExpiredExitToken, InvalidExitToken)
+
+
+def test_legacy_detection():
+    assert is_legacy_token(str(uuid.uuid4()))
+    assert not is_legacy_token(make_token(7, 3, 1))
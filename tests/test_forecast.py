@@ -0,0 +1,95 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pytest
+
+import forecast
+from forecast import OccupancyForecaster, smooth_by_bin
+
+
+def _sequential_ema(groups, values, n_groups, alpha):
+    smoothed, seen = np.zeros(n_groups), np.zeros(n_groups, dtype=bool)
+    for g, v in zip(groups, values):
+        smoothed[g] = alpha * v + (1 - alpha) * smoothed[g] if seen[g] else v
+        seen[g] = True
+    return smoothed, seen
+
+
+@pytest.mark.parametrize("alpha", [0.3, 0.05, 0.9, 1.0])
+def test_smooth_by_bin_matches_sequential_ema(alpha):
+    rng = np.random.default_rng(7)
+    groups = rng.integers(0, 40, size=2000)   # interleaved, some groups empty
+    values = rng.uniform(0, 500, size=groups.size)
+
+    smoothed, seen = smooth_by_bin(groups, values, 50, alpha)
+    expected, expected_seen = _sequential_ema(groups, values, 50, alpha)
+
+    np.testing.assert_allclose(smoothed, expected, rtol=1e-9, atol=1e-9)
+    np.testing.assert_array_equal(seen, expected_seen)
+
+
+def test_single_observation_is_its_own_average():
+    smoothed, seen = smooth_by_bin([3], [42.0], 5, alpha=0.3)
+    assert smoothed[3] == 42.0
+    assert seen.tolist() == [False, False, False, True, False]
+
+
+def _snapshots(n, seed=11):
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            "snapshot_id": i + 1,
+            "lot_code": "main",
+            "vehicle_type": forecast.ALL_TYPES if i % 3 else "4-wheeler",
+            "week_bin": int(rng.integers(0, 20)),
+            "occupied": int(rng.integers(0, 100)),
+            "capacity": 100,
+        }
+        for i in range(n)
+    ]
+
+
+def _profiles(forecaster):
+    return {key: profile[forecaster._seen[key]] for key, profile in forecaster._profiles.items()}
+
+
+def test_fit_matches_update_one_snapshot_at_a_time():
+    rows = _snapshots(600)
+    fitted, updated = OccupancyForecaster(alpha=0.3), OccupancyForecaster(alpha=0.3)
+    fitted.fit(rows)
+    for row in rows:
+        updated.update([row])
+
+    assert fitted._profiles.keys() == updated._profiles.keys()
+    for key in fitted._profiles:
+        np.testing.assert_array_equal(fitted._seen[key], updated._seen[key])
+        np.testing.assert_allclose(fitted._profiles[key], updated._profiles[key], rtol=1e-9)
+    assert fitted._last_id == updated._last_id == 600
+
+
+def test_update_continues_where_fit_left_off():
+    rows = _snapshots(600)
+    whole, resumed = OccupancyForecaster(alpha=0.3), OccupancyForecaster(alpha=0.3)
+    whole.fit(rows)
+    resumed.fit(rows[:400])
+    resumed.update(rows[400:])
+
+    for key, profile in _profiles(whole).items():
+        np.testing.assert_allclose(_profiles(resumed)[key], profile, rtol=1e-9)
+
+
+def test_predict_only_answers_bins_with_history(monkeypatch):
+    monkeypatch.setattr(forecast, "FORECAST_TZ", "UTC")
+    forecaster = OccupancyForecaster(alpha=0.5)
+    forecaster.fit([
+        {"snapshot_id": 1, "lot_code": "main", "vehicle_type": forecast.ALL_TYPES,
+         "week_bin": 0, "occupied": 40, "capacity": 100},
+        {"snapshot_id": 2, "lot_code": "main", "vehicle_type": forecast.ALL_TYPES,
+         "week_bin": 0, "occupied": 60, "capacity": 100},
+    ])
+    monday = datetime(2026, 10, 19, 0, 5, tzinfo=ZoneInfo("UTC"))
+    assert forecaster.predict(monday, lot="main")["expected_occupied"] == 50.0
+    assert forecaster.predict(monday, lot="main")["expected_free"] == 50.0
+    assert forecaster.predict(monday.replace(hour=1), lot="main") is None
+    assert forecaster.predict(monday, lot="other") is None
@@ -0,0 +1,81 @@
+import pytest
+
+from identity import fold_plate
+from plate_index import ActivePlateIndex, ActiveSession, AmbiguousPlate, find_active_session
+
+
+class FakeCursor:
+    """Answers find_active_session's two queries from a list of open sessions."""
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.result = []
+
+    def execute(self, sql, params):
+        if "translate(" in sql:
+            self.result = [s for s in self.sessions if fold_plate(s["license_plate"]) == params[0]]
+        else:
+            self.result = [s for s in self.sessions if s["license_plate"] == params[0]]
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+
+def _row(session_id, plate):
+    return {"session_id": session_id, "vehicle_id": session_id, "slot_id": session_id, "license_plate": plate}
+
+
+def test_fold_plate():
+    assert fold_plate("mh o1-ab i234") == "MH01AB1234"
+    assert fold_plate("MH01AB1234") == "MH01AB1234"
+
+
+def test_lookup_is_exact_only():
+    index = ActivePlateIndex()
+    index.add(ActiveSession(1, 10, 5, "MH01AB1234"))
+    assert index.lookup("mh 01 ab 1234").session_id == 1
+    # A fuzzy read is never answered from the worker-local map
+    assert index.lookup("MHO1AB1234") is None
+
+
+def test_discard_and_replace():
+    index = ActivePlateIndex()
+    index.add(ActiveSession(1, 10, 5, "MH01AB1234"))
+    index.add(ActiveSession(2, 10, 6, "MH01AB1234"))
+    index.discard(1)  # the older session no longer removes the newer entry
+    assert index.lookup("MH01AB1234").session_id == 2
+    index.discard(2)
+    assert index.lookup("MH01AB1234") is None and len(index) == 0
+
+
+def test_load_replaces_contents():
+    index = ActivePlateIndex()
+    index.add(ActiveSession(1, 10, 5, "OLD1"))
+    index.load([_row(2, "NEW2")])
+    assert index.lookup("OLD1") is None
+    assert index.lookup("NEW2").session_id == 2
+
+
+def test_db_exact_match_wins_over_fuzzy():
+    cursor = FakeCursor([_row(1, "MH01AB1234"), _row(2, "MHO1AB1234")])
+    assert find_active_session(cursor, "MHO1AB1234").session_id == 2
+    assert find_active_session(cursor, "MH01AB1234").session_id == 1
+
+
+def test_db_unique_fuzzy_match():
+    cursor = FakeCursor([_row(1, "MH01AB1234")])
+    assert find_active_session(cursor, "MHOIABI234").session_id == 1
+
+
+def test_db_ambiguous_fuzzy_match():
+    cursor = FakeCursor([_row(1, "MH01AB1234"), _row(2, "MHO1AB1234")])
+    with pytest.raises(AmbiguousPlate) as e:
+        find_active_session(cursor, "MH01ABI234")
+    assert e.value.candidates == ["MH01AB1234", "MHO1AB1234"]
+
+
+def test_db_no_match():
+    assert find_active_session(FakeCursor([_row(1, "MH01AB1234")]), "KA05XY9999") is None
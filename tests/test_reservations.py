@@ -0,0 +1,137 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import reservations
+from reservations import ReservationIndex, SlotIntervals, choose_slot, hash_cancel_code, new_cancel_code
+
+HOUR = 3600
+
+
+def test_touching_intervals_do_not_overlap():
+    slot = SlotIntervals()
+    slot.add(10, 20, 1)
+    assert not slot.overlaps(20, 30)   # [10, 20) ends where [20, 30) starts
+    assert not slot.overlaps(0, 10)
+    assert slot.overlaps(19.9, 30)
+    assert slot.overlaps(0, 10.1)
+    assert slot.overlaps(12, 13)        # inside
+    assert slot.overlaps(0, 100)        # around
+
+
+def test_gap_between_bookings():
+    slot = SlotIntervals()
+    slot.add(30, 40, 2)
+    slot.add(10, 20, 1)  # inserted out of order
+    assert slot.starts == [10, 30]
+    assert not slot.overlaps(20, 30)
+    assert slot.overlaps(20, 31)
+
+
+def test_remove():
+    slot = SlotIntervals()
+    slot.add(10, 20, 1)
+    assert not slot.remove(10, 99)
+    assert slot.remove(10, 1)
+    assert not slot.overlaps(0, 100)
+
+
+def _index(n_slots=3):
+    index = ReservationIndex()
+    index.set_slots([{"slot_id": s, "lot_code": "L", "slot_type": None} for s in range(1, n_slots + 1)])
+    return index
+
+
+def test_free_slots_and_peak_booked():
+    index = _index()
+    index.add_interval(1, 1, "KA01AB1234", 0, 2 * HOUR)
+    assert index.free_slots("L", HOUR, 3 * HOUR) == [2, 3]
+    assert index.free_slots("L", 2 * HOUR, 3 * HOUR) == [1, 2, 3]
+    assert index.peak_booked("L", HOUR, 3 * HOUR) == 1
+    assert index.peak_booked("L", 2 * HOUR, 3 * HOUR) == 0
+    index.remove(1)
+    assert index.peak_booked("L", HOUR, 3 * HOUR) == 0
+    assert index.lot_buckets["L"] == {}
+
+
+def test_peak_booked_counts_bookings_at_once():
+    index = _index()
+    index.add_interval(1, 1, "KA01AB1234", 0, HOUR)
+    index.add_interval(2, 2, "KA02CD5678", HOUR, 2 * HOUR)        # after the first: peak stays 1
+    assert index.peak_booked("L", 0, 2 * HOUR) == 1
+    index.add_interval(3, 3, "KA03EF9012", HOUR + 60, 3 * HOUR)   # alongside the second
+    assert index.peak_booked("L", 0, 2 * HOUR) == 2
+    assert index.peak_booked("L", 0, HOUR) == 1
+    assert index.peak_booked("other", 0, 2 * HOUR) == 0
+
+
+def test_peak_booked_survives_slot_reload():
+    index = ReservationIndex()
+    index.add_interval(1, 1, "KA01AB1234", 0, HOUR)   # slot not known yet
+    assert index.peak_booked("L", 0, HOUR) == 0
+    index.set_slots([{"slot_id": 1, "lot_code": "L", "slot_type": None}])
+    assert index.peak_booked("L", 0, HOUR) == 1
+
+
+def test_add_from_row_is_idempotent():
+    index = _index()
+    row = {
+        "reservation_id": 5, "slot_id": 2, "license_plate": "ka 01 ab 1234",
+        "starts_at": datetime(2026, 1, 1, 9, tzinfo=timezone.utc),
+        "ends_at": datetime(2026, 1, 1, 12, tzinfo=timezone.utc),
+    }
+    index.add(row)
+    index.add(row)
+    assert len(index.slots[2].starts) == 1
+    t = row["starts_at"].timestamp()
+    assert not index.is_free(2, t, t + 1)
+
+
+def test_reservation_claimable_within_grace(monkeypatch):
+    monkeypatch.setattr(reservations, "RESERVATION_GRACE_MINUTES", 30)
+    index = _index()
+    index.add_interval(1, 2, "KA01AB1234", 10 * HOUR, 12 * HOUR)
+    assert index.reservation_for("KA01AB1234", 10 * HOUR - 31 * 60) is None
+    assert index.reservation_for("ka01ab1234", 10 * HOUR - 30 * 60) == (1, 2)
+    assert index.reservation_for("KA01AB1234", 12 * HOUR) is None
+
+
+def test_choose_slot_prefers_own_booking():
+    index = _index()
+    index.add_interval(1, 3, "KA01AB1234", 0, HOUR)
+    assert choose_slot(index, "KA01AB1234", 0, iter([1, 2, 3]), lambda s: True) == 3
+    # Own slot taken: falls back to walk-in rules
+    assert choose_slot(index, "KA01AB1234", 0, iter([1, 2]), lambda s: s != 3) == 1
+
+
+def test_choose_slot_holds_booked_slots(monkeypatch):
+    monkeypatch.setattr(reservations, "RESERVATION_HOLD_MINUTES", 120)
+    index = _index()
+    index.add_interval(1, 1, "KA01AB1234", HOUR, 2 * HOUR)       # starts within the hold
+    index.add_interval(2, 2, "KA02CD5678", 3 * HOUR, 4 * HOUR)   # starts after it
+    assert choose_slot(index, None, 0, iter([1, 2, 3]), lambda s: True) == 2
+    assert choose_slot(index, None, 0, iter([1]), lambda s: True) is None
+
+
+def test_choose_slot_consumes_vacant_slots_lazily():
+    seen = []
+
+    def vacant():
+        for slot in (1, 2, 3):
+            seen.append(slot)
+            yield slot
+
+    assert choose_slot(_index(), None, 0, vacant(), lambda s: True) == 1
+    assert seen == [1]
+
+
+def test_cancel_codes():
+    code, digest = new_cancel_code()
+    assert hash_cancel_code(code) == digest
+    assert hash_cancel_code(code + "x") != digest
+    assert new_cancel_code()[0] != code
+
+
+@pytest.mark.parametrize("start,end", [(0, 10), (5, 15)])
+def test_is_free_without_bookings(start, end):
+    assert _index().is_free(1, start, end)